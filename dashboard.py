@@ -4,9 +4,14 @@ import numpy as np
 import os
 import re
 import unicodedata
-import gc
+import tempfile
 import plotly.express as px
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 from io import BytesIO
+import openpyxl
+from pandas.io.parsers import TextParser
 
 # Importações adicionais para a API do GitHub
 import requests
@@ -14,10 +19,57 @@ import base64
 import json
 import io
 import datetime # Para gerar nomes de arquivos únicos
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 
 # O prefixo para os arquivos de histórico dentro do repositório GitHub
 HISTORICO_PREFIX = "historico_atendimentos_"
 HISTORICO_EXTENSION = ".parquet"
+# Arquivos compactados (um por mês) levam este prefixo após HISTORICO_PREFIX
+HISTORICO_MES_PREFIX = "mes_"
+HISTORICO_SEM_DATA = "sem_data"
+# Índice com o intervalo de `data_base` de cada arquivo de histórico
+HISTORICO_MANIFESTO = "historico_manifesto.json"
+# Agregados diários já calculados sobre o histórico inteiro, um arquivo por
+# mês de `data_base` (com partes, se passar de HISTORICO_SHARD_MAX_BYTES)
+HISTORICO_CUBO_PREFIX = "historico_cubo_"
+# IDs de conversa já gravados (128 bits, ordenados) e o hash de cada linha,
+# um arquivo por mês de `data_base` (com partes, se passar de HISTORICO_SHARD_MAX_BYTES)
+HISTORICO_IDS_PREFIX = "historico_ids_"
+
+# Numero maximo de downloads simultaneos de arquivos de historico.
+# Pode ser sobrescrito por `max_workers` na secao [github] do secrets.toml.
+HISTORICO_MAX_WORKERS = 8
+
+# Cache local dos arquivos de historico, endereçado pelo SHA do blob no git
+# (os arquivos sao imutaveis: um SHA conhecido nunca precisa ser baixado de novo).
+HISTORICO_CACHE_DIR = os.path.join("Data", "cache_historico")
+HISTORICO_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+
+# Tamanho máximo de cada arquivo de histórico gravado. Lotes e meses maiores
+# são divididos em partes (`_000`, `_001`, ...) abaixo do limite da API de blobs.
+HISTORICO_SHARD_MAX_BYTES = 32 * 1024 * 1024
+
+# Leitura dos XLSX: só as colunas usadas pelos mapas abaixo são extraídas.
+# Com o pacote opcional python-calamine instalado, ele é usado no lugar do openpyxl.
+EXCEL_LEITURA_SELETIVA = True
+# Linhas por bloco no processamento do Genesys (limita a memória de pico)
+GENESYS_TAMANHO_LOTE = 50_000
+try:
+    import python_calamine  # noqa: F401
+    EXCEL_ENGINE_RAPIDO = "calamine"
+except ImportError:
+    EXCEL_ENGINE_RAPIDO = None
+
+# Cache local do resultado já processado de cada upload (Genesys/Zendesk),
+# endereçado pelo SHA-256 do arquivo: reenviar a mesma exportação não relê o
+# Excel. Mudanças nos mapas de colunas invalidam as entradas sozinhas; para
+# outras mudanças no processamento, incremente UPLOAD_CACHE_VERSAO.
+UPLOAD_CACHE_DIR = os.path.join("Data", "cache_uploads")
+UPLOAD_CACHE_MAX_BYTES = 512 * 1024 * 1024
+UPLOAD_CACHE_VERSAO = 1
 
 st.set_page_config(page_title="Dashboard Call Center", layout="wide")
 
@@ -36,108 +88,327 @@ def get_github_config():
         st.error(f"Erro ao carregar configurações do GitHub: {e}")
         return None, None, None
 
+@st.cache_resource
+def get_github_session():
+    """
+    Sessao HTTP compartilhada (keep-alive) para todas as chamadas ao GitHub.
+    O pool comporta um download simultaneo por worker do historico.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(get_historico_max_workers(), 1))
+    session.mount("https://", adapter)
+    return session
+
+def get_historico_max_workers():
+    try:
+        return int(st.secrets["github"].get("max_workers", HISTORICO_MAX_WORKERS))
+    except Exception:
+        return HISTORICO_MAX_WORKERS
+
 def get_github_headers():
     token, _, _ = get_github_config()
     if not token:
         return {}
     return {"Authorization": f"token {token}", "Accept": "application/vnd.github.v3+json"}
 
-def get_file_sha(path):
-    token, repo, branch = get_github_config()
-    if not token or not repo or not branch:
-        return None
-    url = f"https://api.github.com/repos/{repo}/contents/{path}?ref={branch}"
+def _baixar_blob_github(session, sha, token, repo):
+    """
+    Baixa o conteudo de um blob pelo SHA (Git Data API, formato bruto). O
+    conteudo de um SHA nunca muda, ao contrario do raw.githubusercontent.com,
+    que pode servir uma versao antiga do arquivo logo apos um push.
+    Nao chama `st.*`, para poder rodar em threads; retorna (conteudo, erro).
+    """
+    url = f"https://api.github.com/repos/{repo}/git/blobs/{sha}"
+    headers = {"Authorization": f"token {token}", "Accept": "application/vnd.github.raw+json"}
     try:
-        r   = requests.get(url, headers=get_github_headers())
+        r = session.get(url, headers=headers)
         if r.status_code == 200:
-            data = r.json()
-            if isinstance(data, dict):
-                return data.get("sha")
-        elif r.status_code == 404:
-            return None
-        else:
-            st.error(f"Erro ao obter SHA do arquivo '{path}' do GitHub (Status: {r.status_code}): {r.text}")
+            return r.content, None
+        return None, f"Erro ao baixar o blob '{sha}' do GitHub (Status: {r.status_code}): {r.text}"
     except requests.exceptions.RequestException as e:
-        st.error(f"Erro de conexão ao obter SHA do arquivo '{path}' do GitHub: {e}")
-    return None
+        return None, f"Erro de conexão ao baixar o blob '{sha}' do GitHub: {e}"
 
-def get_file_from_github(path):
+def baixar_blobs_github(shas, max_workers=None):
+    """
+    Baixa varios blobs em paralelo (pool limitado, sessao compartilhada).
+    Retorna a lista de conteudos na mesma ordem de `shas` (None em caso de falha).
+    """
+    token, repo, branch = get_github_config()
+    if not token or not repo or not branch or not shas:
+        return [None] * len(shas)
+    session = get_github_session()
+    workers = max(1, min(max_workers or get_historico_max_workers(), len(shas)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        resultados = list(pool.map(lambda sha: _baixar_blob_github(session, sha, token, repo), shas))
+    conteudos = []
+    for content, erro in resultados:
+        if erro:
+            st.error(erro)
+        conteudos.append(content)
+    return conteudos
+
+def list_files_with_sha_in_github_repo(path=""):
+    """
+    Lista os arquivos de `path` com o SHA do blob de cada um, em uma unica
+    chamada a Git Trees API. Retorna {caminho: sha}.
+    """
     token, repo, branch = get_github_config()
     if not token or not repo or not branch:
-        return None, None
-    raw_url = f"https://raw.githubusercontent.com/{repo}/{branch}/{path}"
+        return {}
+    tree_ref = f"{branch}:{path}" if path else branch
+    url = f"https://api.github.com/repos/{repo}/git/trees/{tree_ref}"
+    prefixo = f"{path.rstrip('/')}/" if path else ""
     try:
-        r = requests.get(raw_url, headers={"Authorization": f"token {token}"})
-        if r.status_code == 200 and len(r.content) > 0:
-            return r.content, get_file_sha(path)
-        elif r.status_code == 404:
-            return None, None
+        r = get_github_session().get(url, headers=get_github_headers())
+        if r.status_code == 200:
+            return {
+                f"{prefixo}{item['path']}": item["sha"]
+                for item in r.json().get("tree", [])
+                if item["type"] == "blob"
+            }
+        elif r.status_code == 404: # Diretório vazio ou não existe
+            return {}
         else:
-            st.error(f"Erro ao baixar arquivo '{path}' do GitHub (Status: {r.status_code}): {r.text}")
+            st.error(f"Erro ao listar arquivos no GitHub (Status: {r.status_code}): {r.text}")
     except requests.exceptions.RequestException as e:
-        st.error(f"Erro de conexão ao baixar arquivo '{path}' do GitHub: {e}")
-    return None, None
+        st.error(f"Erro de conexão ao listar arquivos no GitHub: {e}")
+    return {}
 
-def save_file_to_github(path, content_bytes, message):
-    token, repo, branch = get_github_config()
-    if not token or not repo or not branch:
-        return False
-    sha = get_file_sha(path)
-    url = f"https://api.github.com/repos/{repo}/contents/{path}"
-    payload = {
-        "message": message,
-        "content": base64.b64encode(content_bytes).decode("utf-8"),
-        "branch":  branch
-    }
-    if sha:
-        payload["sha"] = sha
+def _github_api(method, url, payload=None):
+    """
+    Chamada à API REST do GitHub pela sessão compartilhada. Retorna o JSON da
+    resposta ou None (com o erro já exibido).
+    """
     try:
-        r = requests.put(url, headers=get_github_headers(), data=json.dumps(payload))
+        r = get_github_session().request(method, url, headers=get_github_headers(), json=payload)
         if r.status_code in [200, 201]:
-            return True
-        else:
-            st.error(f"Erro ao salvar arquivo '{path}' no GitHub (Status: {r.status_code}): {r.text}")
-            if r.status_code == 422 and "too large" in r.text:
-                st.error("O arquivo é muito grande para ser salvo diretamente no GitHub via API. Considere usar armazenamento em nuvem para arquivos maiores.")
+            return r.json()
+        st.error(f"Erro na API do GitHub ({method} {url}, Status: {r.status_code}): {r.text}")
     except requests.exceptions.RequestException as e:
-        st.error(f"Erro de conexão ao salvar arquivo '{path}' no GitHub: {e}")
-    return False
+        st.error(f"Erro de conexão com a API do GitHub ({method} {url}): {e}")
+    return None
 
-def delete_file_from_github(path, message):
+class _CorpoBlobBase64:
+    """
+    Corpo JSON de `POST /git/blobs` gerado durante o envio: o base64 é
+    codificado em pedaços, sem manter o conteúdo inteiro codificado (nem o
+    JSON) em memória. Tem `__len__` para a requisição sair com Content-Length.
+    """
+    PEDACO = 3 * 256 * 1024  # múltiplo de 3: nenhum padding no meio do texto
+    PREFIXO = b'{"encoding": "base64", "content": "'
+    SUFIXO = b'"}'
+
+    def __init__(self, content_bytes):
+        self._dados = memoryview(content_bytes)
+        self._tamanho = len(self.PREFIXO) + 4 * (-(-len(content_bytes) // 3)) + len(self.SUFIXO)
+        self._pos = 0
+        self._pendente = memoryview(self.PREFIXO)
+
+    def __len__(self):
+        return self._tamanho
+
+    def read(self, n=-1):
+        if n is None or n < 0:
+            n = self._tamanho
+        while len(self._pendente) == 0 and self._pos <= len(self._dados):
+            if self._pos == len(self._dados):
+                self._pendente = memoryview(self.SUFIXO)
+                self._pos += 1
+            else:
+                fim = self._pos + self.PEDACO
+                self._pendente = memoryview(base64.b64encode(self._dados[self._pos:fim]))
+                self._pos = fim if fim < len(self._dados) else len(self._dados)
+        parte, self._pendente = self._pendente[:n], self._pendente[n:]
+        return parte.tobytes()
+
+def _criar_blob_github(session, url, headers, content_bytes):
+    """Cria um blob; retorna (sha, mensagem_de_erro). Pode rodar fora da thread do script."""
+    try:
+        r = session.post(
+            url, headers={**headers, "Content-Type": "application/json"},
+            data=_CorpoBlobBase64(content_bytes),
+        )
+        if r.status_code == 201:
+            return r.json()["sha"], None
+        return None, f"Erro ao criar blob no GitHub (Status: {r.status_code}): {r.text}"
+    except requests.exceptions.RequestException as e:
+        return None, f"Erro de conexão ao criar blob no GitHub: {e}"
+
+def criar_blobs_github(conteudos, max_workers=None):
+    """
+    Cria vários blobs em paralelo (pool limitado, sessão compartilhada).
+    Retorna a lista de SHAs na mesma ordem de `conteudos` (None em caso de falha).
+    """
+    token, repo, branch = get_github_config()
+    if not token or not repo or not branch or not conteudos:
+        return [None] * len(conteudos)
+    session = get_github_session()
+    headers = get_github_headers()
+    url = f"https://api.github.com/repos/{repo}/git/blobs"
+    workers = max(1, min(max_workers or get_historico_max_workers(), len(conteudos)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        resultados = list(pool.map(lambda c: _criar_blob_github(session, url, headers, c), conteudos))
+    shas = []
+    for sha, erro in resultados:
+        if erro:
+            st.error(erro)
+        shas.append(sha)
+    return shas
+
+def commit_arquivos_github(adicionar, remover, message, existentes=None):
+    """
+    Grava vários arquivos ({caminho: bytes}) e exclui outros (lista de caminhos
+    existentes) em um único commit, pela Git Data API (blobs, tree, commit, ref).
+    Cada arquivo novo ou alterado custa um `POST /git/blobs` (em paralelo);
+    só as etapas de ref, árvore e commit são fixas: cinco requisições,
+    quantos arquivos forem.
+
+    `existentes` ({caminho: sha}, da Trees API) é opcional: com ele, arquivos
+    cujo conteúdo não mudou ficam fora do commit, conteúdo que já existe no
+    repositório é referenciado pelo SHA sem novo upload e caminhos ausentes
+    não são removidos.
+    """
     token, repo, branch = get_github_config()
     if not token or not repo or not branch:
         return False
-    sha = get_file_sha(path)
-    if not sha:
+    base = f"https://api.github.com/repos/{repo}/git"
+
+    entradas, novos = [], {}
+    if existentes is not None:
+        blobs_conhecidos = set(existentes.values())
+        remover = [path for path in remover if path in existentes]
+    for path, content_bytes in adicionar.items():
+        if existentes is None:
+            novos[path] = content_bytes
+            continue
+        sha = git_blob_sha(content_bytes)
+        if existentes.get(path) == sha:
+            continue
+        if sha in blobs_conhecidos:
+            entradas.append({"path": path, "mode": "100644", "type": "blob", "sha": sha})
+        else:
+            novos[path] = content_bytes
+    for path in remover:
+        entradas.append({"path": path, "mode": "100644", "type": "blob", "sha": None})
+    if not entradas and not novos:
         return True
-    url = f"https://api.github.com/repos/{repo}/contents/{path}"
-    payload = {"message": message, "sha": sha, "branch": branch}
+
+    ref = _github_api("GET", f"{base}/ref/heads/{branch}")
+    if not ref:
+        return False
+    commit_pai = ref["object"]["sha"]
+    commit = _github_api("GET", f"{base}/commits/{commit_pai}")
+    if not commit:
+        return False
+
+    shas = criar_blobs_github(list(novos.values()))
+    if any(sha is None for sha in shas):
+        return False
+    for path, sha in zip(novos, shas):
+        entradas.append({"path": path, "mode": "100644", "type": "blob", "sha": sha})
+
+    tree = _github_api("POST", f"{base}/trees", {"base_tree": commit["tree"]["sha"], "tree": entradas})
+    if not tree:
+        return False
+    novo_commit = _github_api("POST", f"{base}/commits", {
+        "message": message, "tree": tree["sha"], "parents": [commit_pai],
+    })
+    if not novo_commit:
+        return False
+    return _github_api("PATCH", f"{base}/refs/heads/{branch}", {"sha": novo_commit["sha"]}) is not None
+
+# -------------------- Cache em disco --------------------
+
+def git_blob_sha(content_bytes):
+    """SHA-1 que o git atribui ao blob com este conteúdo (o mesmo da Trees API)."""
+    h = hashlib.sha1(f"blob {len(content_bytes)}\0".encode("ascii"))
+    h.update(content_bytes)
+    return h.hexdigest()
+
+def cache_disco_ler(diretorio, nome):
+    """
+    Lê uma entrada do cache em disco; retorna None se não existir.
+    A leitura atualiza o mtime, que serve de relógio para o descarte LRU.
+    """
+    caminho = os.path.join(diretorio, nome)
     try:
-        r = requests.delete(url, headers=get_github_headers(), data=json.dumps(payload))
-        if r.status_code == 200:
-            return True
-        else:
-            st.error(f"Erro ao excluir arquivo '{path}' do GitHub (Status: {r.status_code}): {r.text}")
-    except requests.exceptions.RequestException as e:
-        st.error(f"Erro de conexão ao excluir arquivo '{path}' do GitHub: {e}")
-    return False
+        with open(caminho, "rb") as f:
+            content = f.read()
+        os.utime(caminho)
+        return content
+    except OSError:
+        return None
 
-def list_files_in_github_repo(path=""):
-    token, repo, branch = get_github_config()
-    if not token or not repo or not branch:
-        return []
-    url = f"https://api.github.com/repos/{repo}/contents/{path}?ref={branch}"
+def cache_disco_gravar(diretorio, nome, content_bytes, max_bytes):
+    """
+    Grava uma entrada de forma atômica e descarta as menos usadas recentemente
+    até o diretório caber em `max_bytes`. Falhas de disco não são fatais.
+    Cada gravação usa um temporário próprio: as sessões do Streamlit são
+    threads do mesmo processo e podem gravar a mesma entrada ao mesmo tempo.
+    """
+    tmp = None
     try:
-        r = requests.get(url, headers=get_github_headers())
-        if r.status_code == 200:
-            return [item["path"] for item in r.json() if item["type"] == "file"]
-        elif r.status_code == 404: # Diretório vazio ou não existe
-            return []
-        else:
-            st.error(f"Erro ao listar arquivos no GitHub (Status: {r.status_code}): {r.text}")
-    except requests.exceptions.RequestException as e:
-        st.error(f"Erro de conexão ao listar arquivos no GitHub: {e}")
-    return []
+        os.makedirs(diretorio, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=diretorio, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(content_bytes)
+        os.replace(tmp, os.path.join(diretorio, nome))
+        tmp = None
+        _cache_disco_podar(diretorio, max_bytes)
+    except OSError:
+        pass
+    finally:
+        if tmp is not None:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+def _cache_disco_podar(diretorio, max_bytes):
+    entradas = []
+    for entrada in os.scandir(diretorio):
+        if entrada.is_file() and not entrada.name.endswith(".tmp"):
+            info = entrada.stat()
+            entradas.append((info.st_mtime, info.st_size, entrada.path))
+    total = sum(tamanho for _, tamanho, _ in entradas)
+    for _, tamanho, caminho in sorted(entradas):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(caminho)
+            total -= tamanho
+        except OSError:
+            pass
+
+def baixar_arquivos_historico(arquivos, max_workers=None):
+    """
+    Conteúdo de cada arquivo de {caminho: sha}, na mesma ordem, baixado pelo
+    SHA do blob. Só os SHAs ausentes do cache em disco vão para a rede; o que
+    é baixado e confere com o SHA esperado entra no cache. Uma entrada do
+    cache que não confere com o SHA (gravação interrompida) é descartada e
+    baixada de novo.
+    """
+    def nome_cache(path, sha):
+        return f"{sha}{os.path.splitext(path)[1]}"
+
+    def ler_cache(path, sha):
+        content = cache_disco_ler(HISTORICO_CACHE_DIR, nome_cache(path, sha))
+        if content is not None and git_blob_sha(content) != sha:
+            try:
+                os.remove(os.path.join(HISTORICO_CACHE_DIR, nome_cache(path, sha)))
+            except OSError:
+                pass
+            return None
+        return content
+
+    conteudos = {path: ler_cache(path, sha) for path, sha in arquivos.items()}
+    faltando = [path for path, content in conteudos.items() if content is None]
+    if faltando:
+        for path, content in zip(faltando, baixar_blobs_github([arquivos[p] for p in faltando], max_workers=max_workers)):
+            conteudos[path] = content
+            if content and git_blob_sha(content) == arquivos[path]:
+                cache_disco_gravar(HISTORICO_CACHE_DIR, nome_cache(path, arquivos[path]), content, HISTORICO_CACHE_MAX_BYTES)
+    return [conteudos[path] for path in arquivos]
 
 def df_to_parquet_bytes(df):
     buf = io.BytesIO()
@@ -146,10 +417,17 @@ def df_to_parquet_bytes(df):
     return buf.getvalue()
 
 def parquet_bytes_to_df(content_bytes, colunas=None):
+    """
+    Lê um Parquet em memória. Com `colunas`, só decodifica as que existirem
+    no arquivo (arquivos antigos podem não ter todas).
+    """
     if not content_bytes:
         return pd.DataFrame()
     try:
         buf = io.BytesIO(content_bytes)
+        if colunas is not None:
+            disponiveis = set(pq.read_schema(buf).names)
+            colunas = [c for c in colunas if c in disponiveis]
         buf.seek(0)
         return pd.read_parquet(buf, engine='pyarrow', columns=colunas)
     except Exception as e:
@@ -187,17 +465,100 @@ def duracao_para_segundos(valor):
     except Exception:
         return np.nan
 
+# Formas canônicas aceitas por duracao_para_segundos: "S", "MM:SS" ou "HH:MM:SS",
+# com espaços entre as partes e qualquer sufixo a partir do primeiro ".".
+# Sintaxe RE2 (pyarrow.compute), com grupos nomeados.
+PADRAO_DURACAO = (
+    r"(?s)^\s*(?P<p1>[0-9]{1,15})\s*(?::\s*(?P<p2>[0-9]{1,15})\s*)?"
+    r"(?::\s*(?P<p3>[0-9]{1,15})\s*)?(?:\..*)?$"
+)
+
+def duracoes_para_segundos(serie):
+    """
+    Versão vetorizada de `duracao_para_segundos` para uma coluna inteira, com
+    os mesmos resultados (em float64). As formas canônicas são convertidas em
+    bloco pelo pyarrow; o que não casar com PADRAO_DURACAO (sinais, notação
+    científica, espaços não ASCII, etc.) cai na função linha a linha.
+    """
+    resultado = np.full(len(serie), np.nan)
+    validos = serie.notna().to_numpy()
+    if not validos.any():
+        return pd.Series(resultado, index=serie.index)
+
+    texto = pc.utf8_trim_whitespace(pa.array(serie[validos].astype(str), type=pa.string()))
+    partes = pc.extract_regex(texto, PADRAO_DURACAO)
+    casou = partes.is_valid().to_numpy(zero_copy_only=False)
+    p1, p2, p3 = (
+        pc.cast(pc.if_else(pc.equal(campo, ""), None, campo), pa.float64()).to_numpy(zero_copy_only=False)
+        for campo in (pc.struct_field(partes, nome) for nome in ("p1", "p2", "p3"))
+    )
+    segundos = np.where(np.isnan(p2), p1, p1 * 60 + p2)
+    segundos = np.where(np.isnan(p3), segundos, p1 * 3600 + p2 * 60 + p3)
+
+    posicoes = np.flatnonzero(validos)
+    resultado[posicoes[casou]] = segundos[casou]
+    if not casou.all():
+        resto = serie.iloc[posicoes[~casou]]
+        resultado[posicoes[~casou]] = resto.apply(duracao_para_segundos).astype("float64").to_numpy()
+    return pd.Series(resultado, index=serie.index)
+
+PADRAO_UUID = r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}"
+
 def normalizar_id(valor):
     if pd.isna(valor):
         return np.nan
     s = str(valor).strip().lower()
     if not s or s == "nan":
         return np.nan
-    match = re.search(
-        r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}', s
-    )
+    match = re.search(PADRAO_UUID, s)
     return match.group(0) if match else np.nan
 
+def normalizar_ids(serie):
+    """
+    Versão vetorizada de `normalizar_id`: minúsculas e extração do UUID em
+    bloco (pyarrow.compute), com NaN onde não houver UUID.
+    """
+    resultado = np.full(len(serie), np.nan, dtype=object)
+    validos = serie.notna().to_numpy()
+    if validos.any():
+        texto = pc.utf8_lower(pa.array(serie[validos].astype(str), type=pa.string()))
+        achados = pc.extract_regex(texto, f"(?P<id>{PADRAO_UUID})")
+        casou = achados.is_valid().to_numpy(zero_copy_only=False)
+        ids = pc.struct_field(achados, "id").to_numpy(zero_copy_only=False)
+        resultado[np.flatnonzero(validos)[casou]] = ids[casou]
+    return pd.Series(resultado, index=serie.index, dtype=object)
+
+def ids_para_inteiros(serie):
+    """
+    Representação compacta de IDs normalizados: os 128 bits do UUID em duas
+    colunas int64 (parte alta e baixa), com <NA> onde o ID é nulo.
+    """
+    validos = serie.notna().to_numpy()
+    hi = np.zeros(len(serie), dtype=np.int64)
+    lo = np.zeros(len(serie), dtype=np.int64)
+    if validos.any():
+        hexa = "".join(serie[validos].astype(str).str.replace("-", "", regex=False))
+        pares = np.frombuffer(bytes.fromhex(hexa), dtype=">u8").reshape(-1, 2).astype(np.uint64).view(np.int64)
+        hi[validos] = pares[:, 0]
+        lo[validos] = pares[:, 1]
+    return (
+        pd.Series(pd.arrays.IntegerArray(hi, ~validos), index=serie.index),
+        pd.Series(pd.arrays.IntegerArray(lo, ~validos), index=serie.index),
+    )
+
+def compactar_ids(df):
+    """
+    Troca `id_genesys_norm` (texto de 36 caracteres) pelas colunas int64
+    `id_genesys_hi`/`id_genesys_lo`, usadas como chave de deduplicação.
+    """
+    if "id_genesys_norm" not in df.columns:
+        return df
+    hi, lo = ids_para_inteiros(df["id_genesys_norm"])
+    df = df.drop(columns=["id_genesys_norm"])
+    df["id_genesys_hi"] = hi
+    df["id_genesys_lo"] = lo
+    return df
+
 def normalizar_col(nome):
     try:
         nome = nome.encode("latin-1").decode("utf-8")
@@ -206,8 +567,95 @@ def normalizar_col(nome):
     nome = unicodedata.normalize("NFKD", nome).encode("ascii", "ignore").decode("ascii")
     return nome.strip().lower()
 
+# Colunas do histórico que cada seção do dashboard lê. O carregamento só
+# decodifica a união delas (mais as chaves de deduplicação).
+COLUNAS_POR_SECAO = {
+    "filtros":          ["data_base", "tipo_desconexao", "nome_agente"],
+    "visao_geral":      ["data_atendimento", "tipo_desconexao", "nome_agente", "assunto",
+                         "duracao_segundos", "ura_segundos", "fila_segundos", "conversas_segundos",
+                         "tpc_segundos", "tratamento_segundos", "abandono_segundos"],
+    "por_agente":       ["nome_agente", "conversas_segundos", "duracao_segundos"],
+    "detalhe_agente":   ["nome_agente", "data_atendimento", "tipo_desconexao", "duracao_segundos",
+                         "ura_segundos", "fila_segundos", "conversas_segundos", "tpc_segundos",
+                         "tratamento_segundos"],
+    "por_assunto":      ["assunto", "conversas_segundos", "duracao_segundos"],
+    "top_assuntos_tma": ["assunto", "mes", "conversas_segundos", "duracao_segundos"],
+    "cubo":             ["data_base", "data_atendimento", "fila", "nome_agente", "assunto",
+                         "tipo_desconexao", "duracao_segundos", "ura_segundos", "fila_segundos",
+                         "conversas_segundos", "tpc_segundos", "tratamento_segundos",
+                         "abandono_segundos"],
+    "deduplicacao":     ["id_genesys_norm", "id_genesys_hi", "id_genesys_lo",
+                         "nome_agente", "data_atendimento", "duracao_segundos"],
+}
+COLUNAS_HISTORICO = sorted({c for cols in COLUNAS_POR_SECAO.values() for c in cols})
+
+# Colunas de texto bruto do Genesys já convertidas em *_segundos/data_atendimento.
+# Com True, deixam de ser gravadas no histórico (economiza espaço, mas o texto
+# original dos lotes novos não pode ser recuperado depois).
+HISTORICO_DESCARTAR_COLUNAS_BRUTAS = False
+
+# Guarda o ID de conversa como dois int64 (id_genesys_hi/lo) em vez de texto,
+# no histórico gravado e em memória. Arquivos antigos são convertidos na leitura.
+HISTORICO_ID_COMPACTO = False
+
+def _colunas_brutas(df):
+    return [c for c in df.columns if c.endswith("_str") or c == "data_atendimento_raw"]
+
+# Tipos compactos do histórico, aplicados ao gravar e ao carregar (e gravados
+# no Parquet, que os preserva na leitura).
+COLUNAS_CATEGORICAS = ["fila", "nome_agente", "tipo_desconexao", "assunto", "mes"]
+INT32_MAX = np.iinfo(np.int32).max
+
+def normalizar_esquema_historico(df):
+    """
+    Texto de baixa cardinalidade como `category`, segundos como `Int32`
+    anulável e o ID de conversa como string Arrow. Colunas já no tipo certo
+    não são tocadas.
+    """
+    df = df.copy(deep=False)
+    for col in COLUNAS_CATEGORICAS:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype("category")
+    for col in df.columns:
+        if col.endswith("_segundos") and df[col].dtype != "Int32":
+            valores = pd.to_numeric(df[col], errors="coerce").astype("float64").round()
+            valores = valores.where(valores.abs() <= INT32_MAX)
+            df[col] = valores.astype("Int32")
+    if "id_genesys_norm" in df.columns and df["id_genesys_norm"].dtype != "string[pyarrow]":
+        df["id_genesys_norm"] = df["id_genesys_norm"].astype("string[pyarrow]")
+    return df
+
+def concatenar_historico(dfs):
+    """
+    `pd.concat` que preserva as colunas categóricas: as categorias de cada
+    coluna são unificadas antes, senão o pandas cairia para `object`.
+    """
+    dfs = [df for df in dfs if not df.empty]
+    if len(dfs) <= 1:
+        return dfs[0].reset_index(drop=True) if dfs else pd.DataFrame()
+    for col in COLUNAS_CATEGORICAS:
+        series = [df[col] for df in dfs if col in df.columns]
+        if len(series) == len(dfs) and all(isinstance(x.dtype, pd.CategoricalDtype) for x in series):
+            # Uma coluna toda nula volta do Parquet com categorias `object`
+            # vazias, que o union_categoricals recusaria ao lado de `str`
+            series = [x for x in series if len(x.cat.categories)] or series[:1]
+            categorias = pd.api.types.union_categoricals(series, ignore_order=True).categories
+            dfs = [df.assign(**{col: df[col].cat.set_categories(categorias)}) for df in dfs]
+    return pd.concat(dfs, ignore_index=True)
+
+def podar_categorias(df):
+    """Remove categorias sem uso (por exemplo, num recorte mensal antes de gravar)."""
+    df = df.copy(deep=False)
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].cat.remove_unused_categories()
+    return df
+
 def _col_tma(df):
-    return "conversas_segundos" if "conversas_segundos" in df.columns else "duracao_segundos"
+    """Coluna do TMA; aceita tanto o histórico linha a linha quanto o cubo."""
+    if "conversas_segundos" in df.columns or "conversas_segundos__n" in df.columns:
+        return "conversas_segundos"
+    return "duracao_segundos"
 
 # -------------------- Mapa Genesys --------------------
 
@@ -236,75 +684,253 @@ def detectar_coluna_agente(colunas):
             return col
     return None
 
-# -------------------- Carregamento --------------------
+# -------------------- Mapa Zendesk --------------------
 
-@st.cache_data(show_spinner="Carregando Genesys...", max_entries=3)
-def carregar_genesys(file_bytes: bytes, file_name: str):
+MAPA_ZENDESK = {
+    "ID do ticket":                              "ticket_id",
+    "Assuntos do Ticket":                        "assunto",
+    "Criacao do ticket - Carimbo de data/hora":  "data_criacao_zen",
+    "Criação do ticket - Carimbo de data/hora":  "data_criacao_zen",
+    "ID Genesys":                                "id_genesys",
+    "Matricula":                                 "matricula",
+    "Tickets":                                   "tickets_zen",
+}
+
+# -------------------- Leitura de Excel --------------------
+
+def _valor_celula_excel(valor):
+    """Mesma conversão do leitor openpyxl do pandas: vazio -> "", float inteiro -> int."""
+    if valor is None:
+        return ""
+    if isinstance(valor, float) and valor.is_integer():
+        return int(valor)
+    return valor
+
+def ler_cabecalho_excel(file_bytes):
+    """Nomes das colunas da primeira aba, lendo só a primeira linha."""
+    wb = openpyxl.load_workbook(BytesIO(file_bytes), read_only=True, data_only=True)
     try:
-        df_raw = pd.read_excel(BytesIO(file_bytes), engine="openpyxl", dtype=str)
+        primeira = next(wb.worksheets[0].iter_rows(max_row=1, values_only=True), ())
+    finally:
+        wb.close()
+    return [str(v) for v in primeira if v is not None]
 
-        renomear = {}
-        for col in df_raw.columns:
-            chave = normalizar_col(col)
-            if chave in MAPA_GENESYS:
-                renomear[col] = MAPA_GENESYS[chave]
+def iterar_lotes_excel(file_bytes, colunas, tamanho_lote):
+    """
+    Percorre a primeira aba em modo read-only do openpyxl e gera DataFrames de
+    até `tamanho_lote` linhas, só com `colunas`, como texto (mesma conversão de
+    `pd.read_excel(..., dtype=str)`). Linhas vazias no fim da planilha são
+    descartadas, como no pandas.
+    """
+    wb = openpyxl.load_workbook(BytesIO(file_bytes), read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[0]
+        ws.reset_dimensions()
+        linhas = ws.iter_rows(values_only=True)
+        cabecalho = next(linhas, ())
+        indices = [i for i, v in enumerate(cabecalho) if v is not None and str(v) in colunas]
+        if not indices:
+            return
+        nomes = [cabecalho[i] for i in indices]
+
+        bloco, vazias = [], []
+        for linha in linhas:
+            valores = [_valor_celula_excel(linha[i]) if i < len(linha) else "" for i in indices]
+            if not any(v is not None and v != "" for v in linha):
+                # Só entra no bloco se aparecer alguma linha com dados depois
+                vazias.append(valores)
+                continue
+            bloco.extend(vazias)
+            vazias = []
+            bloco.append(valores)
+            if len(bloco) >= tamanho_lote:
+                yield TextParser([nomes] + bloco, header=0, dtype=str, skip_blank_lines=False).read()
+                bloco = []
+        if bloco:
+            yield TextParser([nomes] + bloco, header=0, dtype=str, skip_blank_lines=False).read()
+    finally:
+        wb.close()
+
+def ler_excel_colunas(file_bytes, colunas):
+    """
+    Lê apenas `colunas` da primeira aba como texto; equivale a
+    `pd.read_excel(..., dtype=str)` restrito a elas. Com o calamine disponível,
+    delega a ele; senão usa a leitura em blocos de `iterar_lotes_excel`.
+    """
+    colunas = set(colunas)
+    if EXCEL_ENGINE_RAPIDO:
+        return pd.read_excel(BytesIO(file_bytes), engine=EXCEL_ENGINE_RAPIDO, dtype=str,
+                             usecols=lambda c: c in colunas)
+    lotes = list(iterar_lotes_excel(file_bytes, colunas, GENESYS_TAMANHO_LOTE))
+    if not lotes:
+        return pd.DataFrame()
+    return pd.concat(lotes, ignore_index=True)
 
-        col_agente = detectar_coluna_agente(df_raw.columns)
-        if col_agente:
-            renomear[col_agente] = "nome_agente"
-        else:
-            st.warning(f"Coluna de agente nao encontrada. Colunas: {list(df_raw.columns)}")
+def _colunas_genesys(cabecalho):
+    colunas = [c for c in cabecalho if normalizar_col(c) in MAPA_GENESYS]
+    col_agente = detectar_coluna_agente(cabecalho)
+    if col_agente:
+        colunas.append(col_agente)
+    return colunas
 
-        df = df_raw.rename(columns=renomear)
-        del df_raw
-        gc.collect()
+# -------------------- Carregamento --------------------
 
-        if "exportacao" in df.columns:
-            mask = df["exportacao"].astype(str).str.strip().str.lower().isin(["sim", "yes"])
-            df = df[mask].reset_index(drop=True)
+COLS_TEMPO_GENESYS = {
+    "duracao_str":          "duracao_segundos",
+    "total_ura_str":        "ura_segundos",
+    "fila_total_str":       "fila_segundos",
+    "total_conversas_str":  "conversas_segundos",
+    "total_tpc_str":        "tpc_segundos",
+    "tratamento_total_str": "tratamento_segundos",
+    "tempo_abandono_str":   "abandono_segundos",
+}
 
-        if "filtros" in df.columns:
-            df["fila"] = (
-                df["filtros"].astype(str)
-                .str.extract(r"Fila:\s*(.+)", expand=False)
-                .str.strip()
-            )
-        if "fila" not in df.columns:
-            df["fila"] = "URA_CORSAN"
-        df["fila"] = df["fila"].fillna("URA_CORSAN")
-
-        if "data_atendimento_raw" in df.columns:
-            df["data_atendimento"] = pd.to_datetime(
-                df["data_atendimento_raw"].astype(str).str.strip(),
-                errors="coerce", dayfirst=True
-            )
-        else:
-            df["data_atendimento"] = pd.NaT
-
-        cols_tempo = {
-            "duracao_str":          "duracao_segundos",
-            "total_ura_str":        "ura_segundos",
-            "fila_total_str":       "fila_segundos",
-            "total_conversas_str":  "conversas_segundos",
-            "total_tpc_str":        "tpc_segundos",
-            "tratamento_total_str": "tratamento_segundos",
-            "tempo_abandono_str":   "abandono_segundos",
-        }
-        for col_str, col_seg in cols_tempo.items():
-            if col_str in df.columns:
-                df[col_seg] = df[col_str].apply(duracao_para_segundos)
-
-        if "id_genesys" in df.columns:
-            df["id_genesys_norm"] = df["id_genesys"].apply(normalizar_id)
+def _renomear_genesys(colunas, cabecalho=None):
+    renomear = {}
+    for col in colunas:
+        chave = normalizar_col(col)
+        if chave in MAPA_GENESYS:
+            renomear[col] = MAPA_GENESYS[chave]
+
+    col_agente = detectar_coluna_agente(colunas)
+    if col_agente:
+        renomear[col_agente] = "nome_agente"
+    else:
+        st.warning(f"Coluna de agente nao encontrada. Colunas: {cabecalho or list(colunas)}")
+    return renomear
+
+def _transformar_lote_genesys(df_raw, renomear):
+    """Renomeia, filtra e converte um bloco de linhas cruas do Genesys."""
+    df = df_raw.rename(columns=renomear)
+
+    if "exportacao" in df.columns:
+        mask = df["exportacao"].astype(str).str.strip().str.lower().isin(["sim", "yes"])
+        df = df[mask].reset_index(drop=True)
+
+    if "filtros" in df.columns:
+        df["fila"] = (
+            df["filtros"].astype(str)
+            .str.extract(r"Fila:\s*(.+)", expand=False)
+            .str.strip()
+        )
+    if "fila" not in df.columns:
+        df["fila"] = "URA_CORSAN"
+    df["fila"] = df["fila"].fillna("URA_CORSAN")
+
+    if "data_atendimento_raw" in df.columns:
+        df["data_atendimento"] = pd.to_datetime(
+            df["data_atendimento_raw"].astype(str).str.strip(),
+            errors="coerce", dayfirst=True
+        )
+    else:
+        df["data_atendimento"] = pd.NaT
+
+    for col_str, col_seg in COLS_TEMPO_GENESYS.items():
+        if col_str in df.columns:
+            df[col_seg] = duracoes_para_segundos(df[col_str])
+
+    if "id_genesys" in df.columns:
+        df["id_genesys_norm"] = normalizar_ids(df["id_genesys"])
+    else:
+        df["id_genesys_norm"] = np.nan
+
+    if "ani" in df.columns:
+        df["ani"] = df["ani"].astype(str).str.replace(r"^tel:\+", "", regex=True).str.strip()
+
+    if "nome_agente" in df.columns:
+        df["nome_agente"] = df["nome_agente"].astype(str).str.strip()
+        df.loc[df["nome_agente"].str.lower().isin(["nan", "", "none"]), "nome_agente"] = np.nan
+
+    return df
+
+def _esquema_genesys(colunas):
+    """Esquema Arrow fixo para os lotes, para que todos tenham os mesmos tipos."""
+    campos = []
+    for col in colunas:
+        if col.endswith("_segundos"):
+            campos.append(pa.field(col, pa.float64()))
+        elif col == "data_atendimento":
+            campos.append(pa.field(col, pa.timestamp("ns")))
         else:
-            df["id_genesys_norm"] = np.nan
+            campos.append(pa.field(col, pa.string()))
+    return pa.schema(campos)
 
-        if "ani" in df.columns:
-            df["ani"] = df["ani"].astype(str).str.replace(r"^tel:\+", "", regex=True).str.strip()
+def processar_genesys_em_lotes(file_bytes, destino, tamanho_lote=GENESYS_TAMANHO_LOTE):
+    """
+    Pipeline do Genesys em blocos de `tamanho_lote` linhas: leitura, renomeação,
+    filtro de `exportacao`, `fila`, tempos e IDs, gravando cada bloco em um
+    Parquet em `destino` (caminho ou arquivo). A memória de pico depende do
+    tamanho do bloco, não do arquivo. Retorna o número de linhas gravadas.
+    """
+    cabecalho = ler_cabecalho_excel(file_bytes)
+    colunas = _colunas_genesys(cabecalho)
+    renomear = _renomear_genesys(colunas, cabecalho)
 
-        if "nome_agente" in df.columns:
-            df["nome_agente"] = df["nome_agente"].astype(str).str.strip()
-            df.loc[df["nome_agente"].str.lower().isin(["nan", "", "none"]), "nome_agente"] = np.nan
+    writer, total = None, 0
+    try:
+        for lote in iterar_lotes_excel(file_bytes, colunas, tamanho_lote):
+            df = _transformar_lote_genesys(lote, renomear)
+            if writer is None:
+                esquema = _esquema_genesys(df.columns)
+                writer = pq.ParquetWriter(destino, esquema)
+            writer.write_table(pa.Table.from_pandas(df, schema=esquema, preserve_index=False))
+            total += len(df)
+        if writer is None:
+            # Planilha sem linhas: grava só o esquema
+            df = _transformar_lote_genesys(pd.DataFrame(columns=colunas, dtype=object), renomear)
+            esquema = _esquema_genesys(df.columns)
+            writer = pq.ParquetWriter(destino, esquema)
+    finally:
+        if writer is not None:
+            writer.close()
+    return total
+
+def digest_arquivo(file_bytes):
+    """SHA-256 do arquivo enviado: identifica o upload nos caches."""
+    return hashlib.sha256(file_bytes).hexdigest()
+
+def _nome_cache_upload(tipo, digest):
+    config = json.dumps(
+        [UPLOAD_CACHE_VERSAO, MAPA_GENESYS, MAPA_ZENDESK, COLS_TEMPO_GENESYS,
+         PADRAO_AGENTE.pattern, EXCEL_LEITURA_SELETIVA],
+        sort_keys=True,
+    )
+    versao = hashlib.sha1(config.encode("utf-8")).hexdigest()[:12]
+    return f"{tipo}_{digest}_{versao}.parquet"
+
+def ler_cache_upload(tipo, digest):
+    """Resultado já processado de um upload (`tipo` genesys/zendesk) ou None."""
+    content_bytes = cache_disco_ler(UPLOAD_CACHE_DIR, _nome_cache_upload(tipo, digest))
+    if content_bytes is None:
+        return None
+    try:
+        return pd.read_parquet(BytesIO(content_bytes), engine="pyarrow")
+    except Exception:
+        return None
+
+def gravar_cache_upload(tipo, digest, content_bytes):
+    cache_disco_gravar(UPLOAD_CACHE_DIR, _nome_cache_upload(tipo, digest), content_bytes, UPLOAD_CACHE_MAX_BYTES)
+
+@st.cache_data(show_spinner="Carregando Genesys...", max_entries=3)
+def carregar_genesys(_file_bytes: bytes, file_name: str, digest: str):
+    """
+    Interações do Genesys, tipadas. O arquivo é identificado por `digest`
+    (`digest_arquivo`), sem o Streamlit hashear o conteúdo; se ele já foi
+    processado antes, o resultado vem do cache em disco sem abrir o Excel.
+    """
+    try:
+        df = ler_cache_upload("genesys", digest)
+        if df is None:
+            if EXCEL_LEITURA_SELETIVA:
+                with tempfile.TemporaryFile() as tmp:
+                    processar_genesys_em_lotes(_file_bytes, tmp)
+                    tmp.seek(0)
+                    content_bytes = tmp.read()
+            else:
+                df_raw = pd.read_excel(BytesIO(_file_bytes), engine="openpyxl", dtype=str)
+                content_bytes = df_to_parquet_bytes(_transformar_lote_genesys(df_raw, _renomear_genesys(df_raw.columns)))
+            gravar_cache_upload("genesys", digest, content_bytes)
+            df = pd.read_parquet(BytesIO(content_bytes), engine="pyarrow")
 
         st.info(f"Genesys: {len(df)} interacoes carregadas.")
         return df
@@ -314,28 +940,38 @@ def carregar_genesys(file_bytes: bytes, file_name: str):
         return pd.DataFrame()
 
 
-@st.cache_data(show_spinner="Carregando Zendesk...", max_entries=3)
-def carregar_zendesk(file_bytes: bytes, file_name: str):
-    try:
+def _processar_zendesk(file_bytes):
+    if EXCEL_LEITURA_SELETIVA:
+        cabecalho = ler_cabecalho_excel(file_bytes)
+        df = ler_excel_colunas(file_bytes, [c for c in cabecalho if c.strip() in MAPA_ZENDESK])
+    else:
         df = pd.read_excel(BytesIO(file_bytes), engine="openpyxl", dtype=str)
-        df.columns = df.columns.str.strip()
+    df.columns = df.columns.str.strip()
 
-        renomear = {
-            "ID do ticket":                              "ticket_id",
-            "Assuntos do Ticket":                        "assunto",
-            "Criacao do ticket - Carimbo de data/hora":  "data_criacao_zen",
-            "Criação do ticket - Carimbo de data/hora":  "data_criacao_zen",
-            "ID Genesys":                                "id_genesys",
-            "Matricula":                                 "matricula",
-            "Tickets":                                   "tickets_zen",
-        }
-        df = df.rename(columns={k: v for k, v in renomear.items() if k in df.columns})
+    df = df.rename(columns={k: v for k, v in MAPA_ZENDESK.items() if k in df.columns})
 
-        if "data_criacao_zen" in df.columns:
-            df["data_criacao_zen"] = pd.to_datetime(df["data_criacao_zen"], errors="coerce")
+    if "data_criacao_zen" in df.columns:
+        df["data_criacao_zen"] = pd.to_datetime(df["data_criacao_zen"], errors="coerce")
 
-        if "id_genesys" in df.columns:
-            df["id_genesys_norm"] = df["id_genesys"].apply(normalizar_id)
+    if "id_genesys" in df.columns:
+        df["id_genesys_norm"] = normalizar_ids(df["id_genesys"])
+    return df
+
+@st.cache_data(show_spinner="Carregando Zendesk...", max_entries=3)
+def carregar_zendesk(_file_bytes: bytes, file_name: str, digest: str):
+    """Tickets do Zendesk; mesmo esquema de cache de `carregar_genesys`."""
+    try:
+        df = ler_cache_upload("zendesk", digest)
+        if df is None:
+            df = _processar_zendesk(_file_bytes)
+            try:
+                content_bytes = df_to_parquet_bytes(df)
+            except Exception:
+                content_bytes = None  # colunas não serializáveis: só não entra no cache
+            if content_bytes is not None:
+                gravar_cache_upload("zendesk", digest, content_bytes)
+                # Mesmos tipos que um acerto do cache devolveria
+                df = pd.read_parquet(BytesIO(content_bytes), engine="pyarrow")
 
         total = len(df)
         com_id = df["id_genesys_norm"].notna().sum() if "id_genesys_norm" in df.columns else 0
@@ -401,22 +1037,62 @@ def integrar_dados(df_zen, df_gen):
 
 # -------------------- Historico --------------------
 
-@st.cache_data(show_spinner="Carregando historico...", ttl=60)
-def carregar_historico():
+def listar_arquivos_historico(existentes=None):
     """
-    Carrega todos os arquivos de histórico Parquet do GitHub e os concatena.
+    Arquivos de histórico no GitHub, ordenados pelo nome, com o SHA do blob
+    de cada um. Retorna {caminho: sha}. Filtra `existentes` (listagem
+    {caminho: sha} do repositório) quando dada; senão lista o repositório.
     """
-    all_files = list_files_in_github_repo()
-    parquet_files = [f for f in all_files if f.startswith(HISTORICO_PREFIX) and f.endswith(HISTORICO_EXTENSION)]
+    if existentes is None:
+        existentes = list_files_with_sha_in_github_repo()
+    return {
+        f: existentes[f]
+        for f in sorted(existentes, key=_ordem_arquivo_historico)
+        if f.startswith(HISTORICO_PREFIX) and f.endswith(HISTORICO_EXTENSION)
+    }
 
-    if not parquet_files:
-        return pd.DataFrame()
+def _arquivo_compactado(path):
+    return path.startswith(f"{HISTORICO_PREFIX}{HISTORICO_MES_PREFIX}")
+
+def _ordem_arquivo_historico(path):
+    """
+    Os arquivos mensais compactados vêm antes dos lotes com timestamp: todo
+    lote ainda não compactado é mais novo que a última compactação.
+    """
+    return (0 if _arquivo_compactado(path) else 1, path)
 
+def _nome_arquivo_mes(mes):
+    sufixo = HISTORICO_SEM_DATA if pd.isna(mes) else str(mes)
+    return f"{HISTORICO_PREFIX}{HISTORICO_MES_PREFIX}{sufixo}{HISTORICO_EXTENSION}"
+
+def _chaves_deduplicacao(*dfs):
+    """
+    Colunas que identificam um atendimento nos DataFrames dados: o ID de
+    conversa (`id_genesys_norm` ou sua forma compacta) quando disponível em
+    algum deles, senão a combinação agente + data + duração.
+    """
+    for chaves in (["id_genesys_norm"], ["id_genesys_hi", "id_genesys_lo"]):
+        if all(c in df.columns for df in dfs for c in chaves) and any(
+            df[chaves[0]].notna().any() for df in dfs
+        ):
+            return chaves
+    return [
+        c for c in ["nome_agente", "data_atendimento", "duracao_segundos"]
+        if all(c in df.columns for df in dfs)
+    ]
+
+def _ler_arquivos_historico(arquivos, colunas=COLUNAS_HISTORICO, max_workers=None):
+    """
+    Lê os arquivos {caminho: sha} na ordem dada (só as `colunas` pedidas; None
+    lê todas), converte as datas e remove as duplicatas entre eles (mantendo
+    a última ocorrência).
+    """
     dfs = []
-    for file_path in parquet_files:
-        content_bytes, _ = get_file_from_github(file_path)
+    for content_bytes in baixar_arquivos_historico(arquivos, max_workers=max_workers):
         if content_bytes:
-            df_part = parquet_bytes_to_df(content_bytes)
+            df_part = parquet_bytes_to_df(content_bytes, colunas)
+            if HISTORICO_ID_COMPACTO:
+                df_part = compactar_ids(df_part)
             if not df_part.empty:
                 dfs.append(df_part)
         # Não há st.warning aqui, pois você pediu para remover as informações
@@ -425,151 +1101,1044 @@ def carregar_historico():
     if not dfs:
         return pd.DataFrame()
 
-    df_final = pd.concat(dfs, ignore_index=True)
+    df_final = normalizar_esquema_historico(concatenar_historico(dfs))
 
     # Converter colunas de data/hora após a concatenação
     for col in ["data_base", "data_atendimento", "data_criacao_zen"]:
         if col in df_final.columns:
             df_final[col] = pd.to_datetime(df_final[col], errors="coerce")
 
-    # Remover duplicatas após carregar todos os arquivos
-    if "id_genesys_norm" in df_final.columns and df_final["id_genesys_norm"].notna().any():
-        # Prioriza a última ocorrência de um id_genesys_norm, assumindo que é a mais atual
-        df_final = df_final.drop_duplicates(subset=["id_genesys_norm"], keep="last")
-    else:
-        # Fallback para chaves de duplicidade se id_genesys_norm não estiver disponível
-        chaves = [c for c in ["nome_agente", "data_atendimento", "duracao_segundos"] if c in df_final.columns]
-        if chaves:
-            df_final = df_final.drop_duplicates(subset=chaves, keep="last")
+    # Prioriza a última ocorrência de cada atendimento, assumindo que é a mais atual
+    chaves = _chaves_deduplicacao(df_final)
+    if chaves:
+        df_final = df_final.drop_duplicates(subset=chaves, keep="last")
 
     return df_final.reset_index(drop=True)
 
+def entrada_manifesto(df, content_bytes):
+    """
+    Entrada do manifesto para um arquivo: SHA do blob, linhas, intervalo de
+    `data_base` e quantas linhas não têm `data_base`.
+    """
+    datas = pd.to_datetime(df["data_base"], errors="coerce") if "data_base" in df.columns else pd.Series(dtype="datetime64[ns]")
+    tem_datas = datas.notna().any()
+    return {
+        "sha":      git_blob_sha(content_bytes),
+        "linhas":   len(df),
+        "data_min": datas.min().isoformat() if tem_datas else None,
+        "data_max": datas.max().isoformat() if tem_datas else None,
+        "sem_data": int(len(df) - datas.notna().sum()),
+    }
+
+def carregar_manifesto(sha):
+    """
+    Lê o manifesto pelo SHA do blob (da mesma listagem que deu os arquivos,
+    nunca uma cópia antiga em cache de CDN). Retorna o documento: as entradas
+    {caminho: entrada} em "arquivos" e, em "ids" e "cubo", as partições do
+    índice de IDs e do cubo gravadas junto com elas (vazio se não existir).
+    """
+    documento = {}
+    content_bytes = baixar_arquivos_historico({HISTORICO_MANIFESTO: sha})[0] if sha else None
+    if content_bytes:
+        try:
+            documento = json.loads(content_bytes)
+        except ValueError:
+            st.warning("Manifesto do histórico inválido; o período será aplicado após o carregamento completo.")
+    documento.setdefault("arquivos", {})
+    return documento
+
+def completar_manifesto(arquivos, manifesto):
+    """
+    Entradas do manifesto exatamente para os arquivos {caminho: sha}: as que
+    faltarem ou estiverem desatualizadas são recalculadas a partir do arquivo
+    (baixado pelo SHA, em geral já no cache em disco).
+    """
+    entradas = {f: manifesto[f] for f, sha in arquivos.items() if manifesto.get(f, {}).get("sha") == sha}
+    faltando = {f: sha for f, sha in arquivos.items() if f not in entradas}
+    for path, content_bytes in zip(faltando, baixar_arquivos_historico(faltando)):
+        if content_bytes:
+            entradas[path] = entrada_manifesto(parquet_bytes_to_df(content_bytes, ["data_base"]), content_bytes)
+    return {f: entradas[f] for f in arquivos if f in entradas}
+
+def manifesto_para_bytes(documento):
+    return json.dumps(documento, indent=1, sort_keys=True).encode("utf-8")
+
+@st.cache_data(show_spinner=False, ttl=60)
+def carregar_indice_historico():
+    """Arquivos de histórico {caminho: sha} e o manifesto, lidos juntos a cada minuto."""
+    existentes = list_files_with_sha_in_github_repo()
+    return listar_arquivos_historico(existentes), carregar_manifesto(existentes.get(HISTORICO_MANIFESTO))
+
+def _manifesto_cobre(arquivos, manifesto):
+    """O manifesto só é usado se descrever exatamente a versão atual de cada arquivo."""
+    return bool(arquivos) and all(manifesto.get(f, {}).get("sha") == sha for f, sha in arquivos.items())
+
+def _derivado_em_dia(arquivos, documento, chave):
+    """
+    As partições `chave` do manifesto foram gravadas para exatamente estes
+    arquivos {caminho: sha}? Elas vão no mesmo commit que as entradas.
+    """
+    entradas = documento["arquivos"]
+    return chave in documento and entradas.keys() == arquivos.keys() and _manifesto_cobre(arquivos, entradas)
+
+def limites_periodo_historico():
+    """
+    (data mínima, data máxima) do histórico segundo o manifesto, sem baixar
+    nenhum arquivo. None se o manifesto não cobrir todos os arquivos.
+    """
+    arquivos, documento = carregar_indice_historico()
+    manifesto = documento["arquivos"]
+    if not _manifesto_cobre(arquivos, manifesto):
+        return None
+    entradas = [manifesto[f] for f in arquivos if manifesto[f].get("data_min")]
+    if not entradas:
+        return None
+    return (
+        min(pd.Timestamp(e["data_min"]) for e in entradas).date(),
+        max(pd.Timestamp(e["data_max"]) for e in entradas).date(),
+    )
+
+def _arquivo_cruza_meses(entrada, meses):
+    """O arquivo da `entrada` do manifesto pode ter linhas em algum dos `meses`?"""
+    for mes in meses:
+        if mes == HISTORICO_SEM_DATA:
+            if entrada["sem_data"]:
+                return True
+        elif entrada.get("data_min"):
+            ini = pd.Timestamp(mes)
+            if pd.Timestamp(entrada["data_min"]) < ini + pd.offsets.MonthBegin(1) and pd.Timestamp(entrada["data_max"]) >= ini:
+                return True
+    return False
+
+def arquivos_no_periodo(arquivos, manifesto, ini, fim):
+    """
+    Subconjunto de {caminho: sha} cujo intervalo de `data_base` cruza [ini, fim].
+    Arquivos sem datas ficam de fora, pois o filtro de período os descartaria.
+    """
+    if not _manifesto_cobre(arquivos, manifesto):
+        return arquivos
+    ini = pd.Timestamp(ini)
+    fim = pd.Timestamp(fim) + pd.Timedelta(days=1) - pd.Timedelta(seconds=1)
+    return {
+        f: sha for f, sha in arquivos.items()
+        if manifesto[f].get("data_min")
+        and pd.Timestamp(manifesto[f]["data_min"]) <= fim
+        and pd.Timestamp(manifesto[f]["data_max"]) >= ini
+    }
+
+def limpar_cache_historico():
+    carregar_indice_historico.clear()
+    carregar_historico.clear()
+    carregar_cubo.clear()
+
+def mesclar_historico(df_hist, df_novo):
+    """
+    Acrescenta `df_novo` (já sem duplicatas internas) a `df_hist`, descartando
+    do histórico as linhas substituídas por uma ocorrência nova. Equivale a
+    `concat` + `drop_duplicates(keep="last")`, mas só faz hash das chaves novas.
+    """
+    if df_hist.empty:
+        return df_novo.reset_index(drop=True)
+    if df_novo.empty:
+        return df_hist
+
+    chaves = _chaves_deduplicacao(df_novo, df_hist)
+    if not chaves:
+        return normalizar_esquema_historico(concatenar_historico([df_hist, df_novo]))
+
+    if len(chaves) == 1:
+        substituidas = df_hist[chaves[0]].isin(df_novo[chaves[0]])
+    else:
+        substituidas = pd.MultiIndex.from_frame(df_hist[chaves]).isin(
+            pd.MultiIndex.from_frame(df_novo[chaves])
+        )
+    if substituidas.any():
+        df_hist = df_hist[~substituidas]
+    return normalizar_esquema_historico(concatenar_historico([df_hist, df_novo]))
+
+def ordenar_por_data(df, col="data_base"):
+    """Ordena (estável) por `col`, com datas nulas no fim; sem cópia se já estiver ordenado."""
+    if df.empty or col not in df.columns:
+        return df
+    n_datas = int(df[col].notna().sum())
+    inicio = df[col].iloc[:n_datas]
+    if inicio.notna().all() and inicio.is_monotonic_increasing:
+        return df
+    return df.sort_values(col, kind="stable", na_position="last", ignore_index=True)
+
+@st.cache_resource
+def _estado_historico():
+    """
+    Último histórico materializado neste processo e os arquivos {caminho: sha}
+    a partir dos quais ele foi construído.
+    """
+    return {"lock": threading.Lock(), "arquivos": {}, "df": pd.DataFrame()}
+
+@st.cache_data(show_spinner="Carregando historico...", ttl=60, max_entries=8)
+def carregar_historico(periodo=None, max_workers=None):
+    """
+    Carrega todos os arquivos de histórico Parquet do GitHub e os concatena.
+    Com `periodo` (data inicial, data final) e um manifesto atualizado, só os
+    arquivos cujo intervalo de `data_base` cruza o período são lidos.
+    Só os arquivos ausentes do cache em disco são baixados, em paralelo
+    (`max_workers`); a concatenação segue a ordem dos arquivos (mensais
+    compactados, depois lotes por timestamp), para o `keep="last"` continuar valendo.
+
+    Quando os arquivos já carregados continuam iguais e os novos vêm depois
+    deles na ordem, só os novos são lidos e mesclados ao último histórico
+    materializado. Qualquer outra mudança (exclusão, compactação) reconstrói
+    tudo a partir do cache em disco.
+
+    O resultado fica ordenado por `data_base` (datas nulas no fim), o que
+    permite a `aplicar_filtros` recortar o período por busca binária.
+    """
+    parquet_files, documento = carregar_indice_historico()
+    if periodo is not None:
+        parquet_files = arquivos_no_periodo(parquet_files, documento["arquivos"], *periodo)
+    return materializar_historico(parquet_files, max_workers=max_workers)
+
+def materializar_historico(parquet_files, max_workers=None):
+    """
+    Histórico dos arquivos {caminho: sha} dados, ordenado por `data_base`:
+    incremental sobre o último materializado quando possível (ver
+    `carregar_historico`), que passa a ser este.
+    """
+    estado = _estado_historico()
+
+    with estado["lock"]:
+        anteriores = estado["arquivos"]
+        novos = {f: sha for f, sha in parquet_files.items() if f not in anteriores}
+        incremental = (
+            bool(anteriores)
+            and all(parquet_files.get(f) == sha for f, sha in anteriores.items())
+            and (not novos or min(map(_ordem_arquivo_historico, novos)) > max(map(_ordem_arquivo_historico, anteriores)))
+        )
+
+        if not parquet_files:
+            df_final = pd.DataFrame()
+        elif incremental:
+            df_final = mesclar_historico(estado["df"], _ler_arquivos_historico(novos, max_workers=max_workers))
+        else:
+            df_final = _ler_arquivos_historico(parquet_files, max_workers=max_workers)
 
+        df_final = ordenar_por_data(df_final)
+        estado["arquivos"] = parquet_files
+        estado["df"] = df_final
 
-def salvar_novo_historico_parcial(df_novo_lote):
+    return df_final
+
+
+def dividir_em_shards(df, max_bytes=HISTORICO_SHARD_MAX_BYTES):
+    """
+    Serializa `df` em Parquet; se passar de `max_bytes`, divide as linhas (em
+    ordem de `data_base`, para cada parte cobrir um intervalo próprio no
+    manifesto) em partes que caibam no limite. Retorna [(df_parte, bytes)].
+    """
+    content_bytes = df_to_parquet_bytes(df)
+    if len(content_bytes) <= max_bytes or len(df) < 2:
+        return [(df, content_bytes)]
+    # Folga de 20%: o tamanho comprimido não é proporcional ao número de linhas
+    n_partes = min(len(df), -(-5 * len(content_bytes) // (4 * max_bytes)))
+    del content_bytes
+    df = ordenar_por_data(df)
+    limites = np.linspace(0, len(df), n_partes + 1).astype(int)
+    shards = []
+    for ini, fim in zip(limites[:-1], limites[1:]):
+        parte = podar_categorias(df.iloc[ini:fim].reset_index(drop=True))
+        shards.extend(dividir_em_shards(parte, max_bytes))
+    return shards
+
+def _nomes_shards(nome_base, n):
+    """`nome_base` (com extensão) para uma parte só; `_000`, `_001`, ... para várias."""
+    if n == 1:
+        return [nome_base]
+    raiz = nome_base[: -len(HISTORICO_EXTENSION)]
+    return [f"{raiz}_{i:03d}{HISTORICO_EXTENSION}" for i in range(n)]
+
+def _mes_particao(df):
+    """
+    Mês (`AAAA-MM`) de `data_base` de cada linha, ou HISTORICO_SEM_DATA: a
+    partição mensal em que a linha entra no índice de IDs.
+    """
+    if "data_base" not in df.columns:
+        return np.full(len(df), HISTORICO_SEM_DATA, dtype=object)
+    meses = pd.to_datetime(df["data_base"], errors="coerce").to_numpy().astype("datetime64[M]")
+    unicos, inverso = np.unique(meses, return_inverse=True)
+    rotulos = np.array([HISTORICO_SEM_DATA if np.isnat(m) else str(m) for m in unicos], dtype=object)
+    return rotulos[inverso.ravel()]
+
+def gravar_particoes(prefixo, tabelas, anteriores):
+    """
+    Arquivos das partições mensais `prefixo<mes>.parquet`: cada tabela de
+    {mes: DataFrame} substitui a partição do mês em `anteriores` ({mes:
+    {caminho: sha}}, do manifesto); tabela vazia remove o mês. Os demais
+    meses ficam como estão. Retorna (adicionar, remover, partições novas).
+    """
+    adicionar, remover = {}, []
+    particoes = {mes: dict(partes) for mes, partes in anteriores.items()}
+    for mes, tabela in tabelas.items():
+        antigas = particoes.pop(mes, {})
+        if not tabela.empty:
+            shards = dividir_em_shards(tabela)
+            nomes = _nomes_shards(f"{prefixo}{mes}{HISTORICO_EXTENSION}", len(shards))
+            particoes[mes] = {nome: git_blob_sha(content_bytes) for nome, (_, content_bytes) in zip(nomes, shards)}
+            adicionar.update({nome: content_bytes for nome, (_, content_bytes) in zip(nomes, shards)})
+        remover += [path for path in antigas if path not in particoes.get(mes, {})]
+    return adicionar, remover, particoes
+
+def ler_particoes(particoes):
+    """
+    {mes: DataFrame} das partições {mes: {caminho: sha}} do manifesto,
+    baixadas pelo SHA (com o cache em disco). None se alguma falhar.
+    """
+    arquivos = {path: sha for partes in particoes.values() for path, sha in sorted(partes.items())}
+    conteudos = dict(zip(arquivos, baixar_arquivos_historico(arquivos)))
+    if any(content_bytes is None for content_bytes in conteudos.values()):
+        return None
+    return {
+        mes: concatenar_historico([parquet_bytes_to_df(conteudos[path]) for path in sorted(partes)])
+        for mes, partes in particoes.items()
+    }
+
+def gravar_cache_commit(adicionar):
+    """Os arquivos {caminho: bytes} recém-gravados já vão para o cache em disco, pelo SHA do blob."""
+    for path, content_bytes in adicionar.items():
+        nome = f"{git_blob_sha(content_bytes)}{os.path.splitext(path)[1]}"
+        cache_disco_gravar(HISTORICO_CACHE_DIR, nome, content_bytes, HISTORICO_CACHE_MAX_BYTES)
+
+def salvar_novo_historico_parcial(df_novo_lote, descartar_colunas_brutas=HISTORICO_DESCARTAR_COLUNAS_BRUTAS):
     """
     Salva um novo lote de dados como um arquivo Parquet separado no GitHub.
+    Antes, o índice de IDs descarta as linhas que o histórico já tem iguais,
+    de modo que reenviar períodos sobrepostos não duplica o armazenamento.
+    Retorna quantos registros foram gravados (0 se nenhum era novo) ou None
+    em caso de falha.
     """
     if df_novo_lote.empty:
         st.warning("Nenhum dado para salvar no novo arquivo de histórico.")
-        return False
+        return None
+
+    if descartar_colunas_brutas:
+        df_novo_lote = df_novo_lote.drop(columns=_colunas_brutas(df_novo_lote))
+    if HISTORICO_ID_COMPACTO:
+        df_novo_lote = compactar_ids(df_novo_lote)
+    df_novo_lote = normalizar_esquema_historico(df_novo_lote)
+
+    existentes = list_files_with_sha_in_github_repo()
+    arquivos = listar_arquivos_historico(existentes)
+    documento = carregar_manifesto(existentes.get(HISTORICO_MANIFESTO))
+    indice_em_dia = _derivado_em_dia(arquivos, documento, "ids")
+    indice = carregar_indice_ids(arquivos, documento)
+    recebidos = len(df_novo_lote)
+    df_novo_lote = filtrar_lote_novo(df_novo_lote, indice)
+    if df_novo_lote.empty:
+        st.info(f"Os {recebidos} registros do lote já estão no histórico; nada foi gravado.")
+        return 0
+    if len(df_novo_lote) < recebidos:
+        st.info(f"{recebidos - len(df_novo_lote)} de {recebidos} registros já estavam no histórico e foram ignorados.")
 
     timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    new_file_name = f"{HISTORICO_PREFIX}{timestamp}{HISTORICO_EXTENSION}"
+    shards = dividir_em_shards(df_novo_lote)
+    nomes = _nomes_shards(f"{HISTORICO_PREFIX}{timestamp}{HISTORICO_EXTENSION}", len(shards))
 
-    st.info(f"Tentando salvar novo arquivo de histórico no GitHub: '{new_file_name}'")
-    content_bytes = df_to_parquet_bytes(df_novo_lote)
+    if len(shards) == 1:
+        st.info(f"Tentando salvar novo arquivo de histórico no GitHub: '{nomes[0]}'")
+    else:
+        st.info(f"Tentando salvar novo lote no GitHub em {len(shards)} arquivos ('{nomes[0]}', ...)")
+
+    # As partes do lote, suas entradas no manifesto e as partições alteradas
+    # do índice de IDs e do cubo vão no mesmo commit
+    manifesto = completar_manifesto(arquivos, documento["arquivos"])
+    adicionar = {}
+    for nome, (df_parte, content_bytes) in zip(nomes, shards):
+        manifesto[nome] = entrada_manifesto(df_parte, content_bytes)
+        adicionar[nome] = content_bytes
+
+    # Com o índice em dia, só os meses alterados pelo lote são regravados;
+    # senão (histórico antigo ou alterado fora do app), todos
+    indice, meses_alterados = atualizar_indice_ids(indice, df_novo_lote)
+    anteriores = documento.get("ids", {})
+    if not indice_em_dia:
+        meses_alterados = set(indice) | set(anteriores)
+    adicionar_ids, remover, particoes_ids = gravar_particoes(
+        HISTORICO_IDS_PREFIX, {mes: _indice_para_tabela(*indice.get(mes, _INDICE_VAZIO)) for mes in meses_alterados}, anteriores
+    )
+    adicionar.update(adicionar_ids)
+
+    # O cubo também: os meses alterados são reagregados a partir só dos
+    # arquivos que os cruzam
+    anteriores = documento.get("cubo", {})
+    meses_cubo = meses_alterados | set(_mes_particao(df_novo_lote))
+    if _derivado_em_dia(arquivos, documento, "cubo"):
+        cubo = construir_cubo(historico_dos_meses(arquivos, manifesto, meses_cubo, df_novo_lote, indice))
+    else:
+        cubo = construir_cubo(adicionar_ao_historico(df_novo_lote, historico_completo(arquivos)))
+        meses_cubo = None
+    tabelas = {mes: pd.DataFrame() for mes in anteriores} if meses_cubo is None else {}
+    tabelas.update(cubo_por_mes(cubo, meses_cubo))
+    adicionar_cubo, remover_cubo, particoes_cubo = gravar_particoes(HISTORICO_CUBO_PREFIX, tabelas, anteriores)
+    adicionar.update(adicionar_cubo)
+    remover += remover_cubo
+    adicionar[HISTORICO_MANIFESTO] = manifesto_para_bytes({"arquivos": manifesto, "ids": particoes_ids, "cubo": particoes_cubo})
+
+    if commit_arquivos_github(adicionar, remover, f"Adiciona novo lote de dados ({timestamp})", existentes=existentes):
+        gravar_cache_commit(adicionar)
+        limpar_cache_historico() # Limpa o cache para recarregar os arquivos
+        return len(df_novo_lote)
+    return None
 
-    if save_file_to_github(new_file_name, content_bytes, f"Adiciona novo lote de dados ({timestamp})"):
-        carregar_historico.clear() # Limpa o cache para recarregar todos os arquivos
+def compactar_historico():
+    """
+    Reescreve o histórico como um arquivo por mês (`mes`, em partes se passar
+    de HISTORICO_SHARD_MAX_BYTES), com a mesma remoção de duplicatas do
+    carregamento, e troca os arquivos antigos pelos compactados em um único
+    commit. Pode ser chamada fora da interface.
+    """
+    existentes = list_files_with_sha_in_github_repo()
+    arquivos = listar_arquivos_historico(existentes)
+    if all(_arquivo_compactado(f) for f in arquivos):
+        st.info("Nenhum lote novo para compactar.")
         return True
-    return False
+
+    df = _ler_arquivos_historico(arquivos, colunas=None)
+    if df.empty:
+        st.warning("Não foi possível ler o histórico para compactar.")
+        return False
+
+    meses = df["mes"] if "mes" in df.columns else pd.Series(np.nan, index=df.index)
+    mensais, manifesto = {}, {}
+    for mes, df_mes in df.groupby(meses, dropna=False, sort=True, observed=True):
+        shards = dividir_em_shards(podar_categorias(df_mes.reset_index(drop=True)))
+        for path, (df_parte, content_bytes) in zip(_nomes_shards(_nome_arquivo_mes(mes), len(shards)), shards):
+            mensais[path] = content_bytes
+            manifesto[path] = entrada_manifesto(df_parte, content_bytes)
+    # Meses cujo conteúdo não mudou já têm o mesmo blob no repositório
+    adicionar = {f: b for f, b in mensais.items() if arquivos.get(f) != manifesto[f]["sha"]}
+    remover = [f for f in arquivos if f not in mensais]
+
+    # Índice de IDs e cubo reconstruídos, mês a mês; partições de meses que
+    # sumiram são removidas
+    documento = carregar_manifesto(existentes.get(HISTORICO_MANIFESTO))
+    particoes = {}
+    for chave, prefixo, novas in (
+        ("ids", HISTORICO_IDS_PREFIX, {mes: _indice_para_tabela(*ids_hashes) for mes, ids_hashes in construir_indice_ids(df).items()}),
+        ("cubo", HISTORICO_CUBO_PREFIX, cubo_por_mes(construir_cubo(df))),
+    ):
+        anteriores = documento.get(chave, {})
+        tabelas = {mes: pd.DataFrame() for mes in anteriores}
+        tabelas.update(novas)
+        adicionar_part, remover_part, particoes[chave] = gravar_particoes(prefixo, tabelas, anteriores)
+        adicionar.update(adicionar_part)
+        remover += remover_part
+    adicionar[HISTORICO_MANIFESTO] = manifesto_para_bytes({"arquivos": manifesto, **particoes})
+
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    if not commit_arquivos_github(adicionar, remover, f"Compacta histórico em arquivos mensais ({timestamp})", existentes=existentes):
+        return False
+
+    gravar_cache_commit(adicionar)
+    limpar_cache_historico()
+    st.success(f"Histórico compactado: {len(arquivos)} arquivos substituídos por {len(mensais)} mensais.")
+    return True
 
 def adicionar_ao_historico(df_novo, df_hist):
     # Esta função agora apenas combina os dados em memória para a análise atual
     # A persistência de df_novo será feita separadamente por salvar_novo_historico_parcial
-    if df_hist.empty:
-        return df_novo.reset_index(drop=True)
+    chaves = _chaves_deduplicacao(df_novo)
+    if chaves:
+        df_novo = df_novo.drop_duplicates(subset=chaves, keep="last")
+    return mesclar_historico(df_hist, df_novo).reset_index(drop=True)
 
-    df_comb = pd.concat([df_hist, df_novo], ignore_index=True)
 
-    if "id_genesys_norm" in df_comb.columns and df_comb["id_genesys_norm"].notna().any():
-        # Remove duplicatas baseadas em id_genesys_norm, mantendo a última ocorrência
-        df_comb = df_comb.drop_duplicates(subset=["id_genesys_norm"], keep="last")
-    else:
-        # Fallback para remover duplicatas se id_genesys_norm não estiver disponível
-        chaves = [c for c in ["nome_agente", "data_atendimento", "duracao_segundos"] if c in df_comb.columns]
-        if chaves:
-            df_comb = df_comb.drop_duplicates(subset=chaves, keep="last")
+# -------------------- Cubo de agregados --------------------
 
-    return df_comb.reset_index(drop=True)
+COLUNAS_SEGUNDOS = [
+    "duracao_segundos", "ura_segundos", "fila_segundos", "conversas_segundos",
+    "tpc_segundos", "tratamento_segundos", "abandono_segundos",
+]
+DIMENSOES_CUBO = ["dia", "fila", "nome_agente", "assunto", "tipo_desconexao"]
+
+def construir_cubo(df):
+    """
+    Agrega o histórico por dia (de `data_base`) x fila x agente x assunto x tipo
+    de desconexão. Para cada grupo: `atendimentos`, `com_data_atendimento` e,
+    por coluna de segundos, `<col>__soma` e `<col>__n` (não nulos). Médias e
+    totais das seções saem dessas somas. Inclui `mes` derivado do dia.
+    """
+    if df.empty:
+        return pd.DataFrame()
+
+    dia = df["data_base"].dt.normalize() if "data_base" in df.columns else pd.Series(pd.NaT, index=df.index)
+    chaves = [dia.rename("dia")] + [
+        df[dim] if dim in df.columns else pd.Series(np.nan, index=df.index, dtype=object, name=dim)
+        for dim in DIMENSOES_CUBO[1:]
+    ]
+
+    medidas = {"atendimentos": np.ones(len(df), dtype=np.int64)}
+    if "data_atendimento" in df.columns:
+        medidas["com_data_atendimento"] = df["data_atendimento"].notna().to_numpy(dtype=np.int64)
+    for col in COLUNAS_SEGUNDOS:
+        if col in df.columns:
+            valores = pd.to_numeric(df[col], errors="coerce").astype("float64")
+            medidas[f"{col}__soma"] = valores.fillna(0).to_numpy()
+            medidas[f"{col}__n"] = valores.notna().to_numpy(dtype=np.int64)
+
+    cubo = (
+        pd.DataFrame(medidas, index=df.index)
+        .groupby(chaves, dropna=False, observed=True, sort=True)
+        .sum()
+        .reset_index()
+    )
+    cubo["mes"] = cubo["dia"].dt.strftime("%Y-%m")
+    return normalizar_esquema_historico(cubo)
+
+def cubo_por_mes(cubo, meses=None):
+    """
+    Partições {mes: cubo do mês} do cubo (a chave de mês é a mesma de
+    `_mes_particao`). Com `meses`, só esses, vazios se não tiverem linhas.
+    """
+    rotulos = cubo["mes"].astype(object).fillna(HISTORICO_SEM_DATA).to_numpy() if "mes" in cubo.columns else np.empty(0, dtype=object)
+    if meses is None:
+        meses = set(rotulos)
+    return {mes: podar_categorias(cubo[rotulos == mes].reset_index(drop=True)) if len(rotulos) else pd.DataFrame() for mes in meses}
+
+def historico_completo(arquivos):
+    """Histórico inteiro de {caminho: sha}, reaproveitando o já materializado se for o mesmo."""
+    estado = _estado_historico()
+    with estado["lock"]:
+        if estado["arquivos"] == arquivos:
+            return estado["df"]
+    return _ler_arquivos_historico(arquivos, colunas=COLUNAS_HISTORICO)
+
+def historico_dos_meses(arquivos, manifesto, meses, df_lote, indice):
+    """
+    Linhas do histórico, já com `df_lote` mesclado, cujo mês de `data_base`
+    está em `meses`. Só os arquivos que o manifesto diz cruzarem esses meses
+    são lidos. Um atendimento cuja versão mais nova está em outro mês (pelo
+    `indice` atualizado) fica de fora, como na leitura completa.
+    """
+    estado = _estado_historico()
+    with estado["lock"]:
+        df_hist = estado["df"] if estado["arquivos"] == arquivos else None
+    if df_hist is None:
+        fontes = {f: sha for f, sha in arquivos.items() if _arquivo_cruza_meses(manifesto[f], meses)}
+        df_hist = _ler_arquivos_historico(fontes) if fontes else pd.DataFrame()
+    df = adicionar_ao_historico(df_lote, df_hist)
+
+    rotulos = _mes_particao(df)
+    dentro = np.isin(rotulos, list(meses))
+    df, rotulos = df[dentro], rotulos[dentro]
+    ids, validos = _ids_128(df)
+    if ids is None:
+        return df
+    atual = ~validos
+    for mes in meses:
+        linhas = rotulos == mes
+        _, achou = _buscar_ids(indice.get(mes, _INDICE_VAZIO)[0], ids[linhas])
+        atual[linhas] |= achou
+    return df[atual]
+
+@st.cache_data(show_spinner="Carregando agregados...", ttl=60, max_entries=8)
+def carregar_cubo(periodo=None):
+    """
+    Cubo do histórico para as seções e a versão que o identifica. Usa as
+    partições mensais gravadas no GitHub se o manifesto as tiver gravado para
+    exatamente os arquivos atuais (baixadas pelo SHA; com `periodo`, só as
+    dos meses que ele cruza); senão agrega o histórico desses arquivos
+    (podado por `periodo`, se houver manifesto).
+
+    A versão sai da mesma listagem de que o cubo foi construído (e leva o
+    período quando o cubo não cobre o histórico inteiro), para as memoizações
+    das seções nunca guardarem um cubo antigo sob a chave de uma versão nova.
+    """
+    arquivos, documento = carregar_indice_historico()
+    versao = versao_historico(arquivos)
+    if not arquivos:
+        return pd.DataFrame(), versao
+    if _derivado_em_dia(arquivos, documento, "cubo"):
+        particoes = documento["cubo"]
+        if periodo is not None:
+            meses = set(pd.period_range(periodo[0], periodo[1], freq="M").astype(str))
+            particoes = {mes: partes for mes, partes in particoes.items() if mes in meses}
+        tabelas = ler_particoes(particoes)
+        if tabelas is not None:
+            cubo = concatenar_historico([tabelas[mes] for mes in sorted(tabelas)])
+            if len(particoes) < len(documento["cubo"]):
+                versao = f"{versao}:{periodo}"
+            return ordenar_por_data(normalizar_esquema_historico(cubo), "dia"), versao
+    if periodo is not None:
+        arquivos = arquivos_no_periodo(arquivos, documento["arquivos"], *periodo)
+        versao = f"{versao}:{periodo}"
+    return construir_cubo(materializar_historico(arquivos)), versao
+
+
+# -------------------- Indice de IDs --------------------
+
+# Colunas cujo conteúdo distingue uma versão de um atendimento da outra
+COLUNAS_ID = ["id_genesys_norm", "id_genesys_hi", "id_genesys_lo"]
+COLUNAS_CONTEUDO = [c for c in COLUNAS_HISTORICO if c not in COLUNAS_ID]
+
+def _ids_128(df):
+    """
+    IDs de conversa de `df` como chaves de 128 bits (dtype V16, comparáveis e
+    ordenáveis pelo numpy) e a máscara das linhas que têm ID. Aceita a forma
+    em texto, a compacta ou uma mistura das duas. (None, None) sem IDs.
+    """
+    if not any(c in df.columns for c in COLUNAS_ID):
+        return None, None
+    hi = pd.Series(pd.NA, index=df.index, dtype="Int64")
+    lo = pd.Series(pd.NA, index=df.index, dtype="Int64")
+    if "id_genesys_norm" in df.columns:
+        hi, lo = ids_para_inteiros(df["id_genesys_norm"])
+    if "id_genesys_hi" in df.columns and "id_genesys_lo" in df.columns:
+        hi = df["id_genesys_hi"].astype("Int64").fillna(hi)
+        lo = df["id_genesys_lo"].astype("Int64").fillna(lo)
+    validos = (hi.notna() & lo.notna()).to_numpy()
+    pares = np.column_stack([
+        hi.to_numpy(dtype=np.int64, na_value=0), lo.to_numpy(dtype=np.int64, na_value=0)
+    ])
+    return np.ascontiguousarray(pares).view("V16").ravel(), validos
+
+def _hash_linhas(df):
+    """
+    Hash (uint64) do conteúdo de cada linha nas COLUNAS_CONTEUDO. Nulos e
+    colunas ausentes contam igual, e datas são comparadas em ns, para que o
+    lote e o histórico lido do GitHub gerem o mesmo hash para a mesma linha.
+    """
+    h = np.zeros(len(df), dtype=np.uint64)
+    for col in COLUNAS_CONTEUDO:
+        hc = np.zeros(len(df), dtype=np.uint64)
+        if col in df.columns:
+            serie = df[col]
+            if pd.api.types.is_datetime64_any_dtype(serie):
+                serie = serie.astype("datetime64[ns]")
+            hc = np.where(serie.isna().to_numpy(), np.uint64(0), pd.util.hash_pandas_object(serie, index=False).to_numpy())
+        h = h * np.uint64(1_000_003) ^ hc
+    return h
+
+_INDICE_VAZIO = (np.empty(0, dtype="V16"), np.empty(0, dtype=np.uint64))
+
+def construir_indice_ids(df):
+    """
+    Índice das linhas de `df` com ID, por mês de `data_base`: {mes: (ids,
+    hashes)}, com as chaves V16 ordenadas dentro do mês. Cada atendimento
+    aparece uma vez (a última ocorrência), no mês dessa ocorrência.
+    """
+    ids, validos = _ids_128(df)
+    if ids is None or not validos.any():
+        return {}
+    ids, hashes, meses = ids[validos], _hash_linhas(df)[validos], _mes_particao(df)[validos]
+    ordem = np.argsort(ids, kind="stable")
+    ids, hashes, meses = ids[ordem], hashes[ordem], meses[ordem]
+    ultima = np.append(ids[1:] != ids[:-1], True)
+    ids, hashes, meses = ids[ultima], hashes[ultima], meses[ultima]
+    # Agrupa por mês sem perder a ordem dos IDs (ordenação estável)
+    codigos, rotulos = pd.factorize(meses)
+    ordem = np.argsort(codigos, kind="stable")
+    limites = np.cumsum(np.bincount(codigos, minlength=len(rotulos)))[:-1]
+    return {
+        mes: (ids_mes, hashes_mes)
+        for mes, ids_mes, hashes_mes in zip(rotulos, np.split(ids[ordem], limites), np.split(hashes[ordem], limites))
+    }
+
+def _buscar_ids(ids, chaves):
+    """Posição de cada chave no índice ordenado `ids` e se ela está lá."""
+    if len(ids) == 0:
+        return np.zeros(len(chaves), dtype=np.intp), np.zeros(len(chaves), dtype=bool)
+    pos = np.minimum(np.searchsorted(ids, chaves), len(ids) - 1)
+    return pos, ids[pos] == chaves
+
+def atualizar_indice_ids(indice, df_lote):
+    """
+    Índice com as linhas de `df_lote` acrescentadas (IDs novos) ou substituídas,
+    e os meses cujas partições mudaram: os do lote e aqueles de onde saiu a
+    versão anterior de um atendimento (se a data dele mudou de mês).
+    """
+    lote = construir_indice_ids(df_lote)
+    if not lote:
+        return indice, set()
+    ids_lote = np.concatenate([ids for ids, _ in lote.values()])
+    novo, alterados = {}, set(lote)
+    for mes, (ids, hashes) in indice.items():
+        pos, achou = _buscar_ids(ids, ids_lote)
+        if achou.any():
+            manter = np.ones(len(ids), dtype=bool)
+            manter[pos[achou]] = False
+            ids, hashes = ids[manter], hashes[manter]
+            alterados.add(mes)
+        novo[mes] = (ids, hashes)
+    for mes, (ids_mes, hashes_mes) in lote.items():
+        ids, hashes = novo.get(mes, _INDICE_VAZIO)
+        # Os novos entram em ordem nas posições de inserção, sem reordenar tudo
+        insercao = np.searchsorted(ids, ids_mes)
+        novo[mes] = (np.insert(ids, insercao, ids_mes), np.insert(hashes, insercao, hashes_mes))
+    return novo, alterados
+
+def filtrar_lote_novo(df_lote, indice):
+    """
+    Só as linhas de `df_lote` que o histórico ainda não tem iguais: IDs
+    novos, IDs conhecidos com conteúdo diferente e linhas sem ID. O lote é
+    antes reduzido à última ocorrência de cada atendimento, como na leitura.
+    """
+    chaves = _chaves_deduplicacao(df_lote)
+    if chaves:
+        df_lote = df_lote.drop_duplicates(subset=chaves, keep="last")
+    ids_lote, validos = _ids_128(df_lote)
+    if ids_lote is None or not indice:
+        return df_lote
+    hashes_lote = _hash_linhas(df_lote)
+    igual = np.zeros(len(df_lote), dtype=bool)
+    for ids, hashes in indice.values():
+        pos, achou = _buscar_ids(ids, ids_lote)
+        igual |= validos & achou & (hashes[pos] == hashes_lote)
+    return df_lote[~igual] if igual.any() else df_lote
+
+def _indice_para_tabela(ids, hashes):
+    """Partição do índice como tabela (id_hi, id_lo, hash), para gravar em Parquet."""
+    pares = ids.view(np.int64).reshape(-1, 2)
+    return pd.DataFrame({"id_hi": pares[:, 0], "id_lo": pares[:, 1], "hash": hashes})
+
+def _tabela_para_indice(tabela):
+    """Inverso de `_indice_para_tabela`: retorna (ids, hashes)."""
+    if tabela.empty:
+        return _INDICE_VAZIO
+    pares = np.column_stack([tabela["id_hi"].to_numpy(dtype=np.int64), tabela["id_lo"].to_numpy(dtype=np.int64)])
+    return np.ascontiguousarray(pares).view("V16").ravel(), tabela["hash"].to_numpy(dtype=np.uint64)
+
+def carregar_indice_ids(arquivos, documento):
+    """
+    Índice de IDs {mes: (ids, hashes)} que cobre exatamente os arquivos
+    {caminho: sha}: as partições do manifesto se estiverem em dia (baixadas
+    pelo SHA), senão reconstruído a partir do histórico.
+    """
+    if _derivado_em_dia(arquivos, documento, "ids"):
+        tabelas = ler_particoes(documento["ids"])
+        if tabelas is not None:
+            return {mes: _tabela_para_indice(tabela) for mes, tabela in tabelas.items()}
+    return construir_indice_ids(historico_completo(arquivos))
 
 
 # -------------------- Filtros --------------------
 
-def aplicar_filtros(df):
-    st.sidebar.header("Filtros")
-    df_f = df.copy()
-
-    if "data_base" in df_f.columns and df_f["data_base"].notna().any():
-        min_data = df_f["data_base"].min().date()
-        max_data = df_f["data_base"].max().date()
-        periodo = st.sidebar.date_input(
-            "Periodo",
-            value=(min_data, max_data),
-            min_value=min_data,
-            max_value=max_data,
-            key="filtro_periodo"
-        )
-        if isinstance(periodo, (list, tuple)) and len(periodo) == 2:
+def selecionar_periodo(min_data, max_data):
+    """Widget de período; retorna (data inicial, data final) ou None se incompleto."""
+    periodo = st.sidebar.date_input(
+        "Periodo",
+        value=(min_data, max_data),
+        min_value=min_data,
+        max_value=max_data,
+        key="filtro_periodo"
+    )
+    if isinstance(periodo, (list, tuple)) and len(periodo) == 2:
+        return tuple(periodo)
+    return None
+
+def _fatia_periodo(datas, ini, fim):
+    """
+    Posições [i, j) das linhas com data em [ini, fim]. `datas` ordenadas com
+    os nulos no fim (NaT fica depois de qualquer data na busca binária).
+    """
+    valores = datas.to_numpy()
+    return (
+        int(valores.searchsorted(ini.to_datetime64(), side="left")),
+        int(valores.searchsorted(fim.to_datetime64(), side="right")),
+    )
+
+def _opcoes(serie, mascara=None):
+    """
+    Valores distintos e não nulos de `serie` (só nas linhas de `mascara`),
+    ordenados. Categóricas são contadas pelos códigos, sem materializar a seleção.
+    """
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        codigos = serie.cat.codes.to_numpy()
+        if mascara is not None:
+            codigos = codigos[mascara]
+        presentes = np.bincount(codigos + 1, minlength=len(serie.cat.categories) + 1)[1:] > 0
+        return sorted(serie.cat.categories[presentes].tolist())
+    if mascara is not None:
+        serie = serie[mascara]
+    return sorted(pd.Series(serie.unique()).dropna().tolist())
+
+def aplicar_filtros(df, periodo=None, versao=None):
+    """
+    Aplica os filtros da barra lateral ao histórico ou ao cubo (cuja data é
+    `dia`). Se o período já foi escolhido antes do carregamento (histórico
+    podado pelo manifesto), ele é recebido em `periodo`.
+
+    Espera o `df` ordenado por data (`ordenar_por_data`, como o histórico e o
+    cubo já chegam): o período é um recorte por busca binária; tipo e agente
+    viram uma única máscara, aplicada uma vez no fim. Não copia o `df` quando
+    nenhum filtro restringe as linhas.
+
+    Com `versao` (que identifica o `df` recebido: a versão do histórico, mais
+    o período se o `df` já veio podado por ele), as opções de tipo e agente
+    são as do `df` inteiro, calculadas uma vez por versão; sem ela, são as
+    que restam após os filtros anteriores.
+    """
+    opcoes = opcoes_filtros(df, versao) if versao is not None else None
+    df_f = df
+    col_data = "data_base" if "data_base" in df_f.columns else "dia"
+
+    # Ordenado com as datas nulas no fim: basta olhar a primeira linha
+    if col_data in df_f.columns and len(df_f) and pd.notna(df_f[col_data].iloc[0]):
+        if periodo is None:
+            periodo = selecionar_periodo(df_f[col_data].min().date(), df_f[col_data].max().date())
+        if periodo is not None:
             ini = pd.Timestamp(periodo[0])
             fim = pd.Timestamp(periodo[1]) + pd.Timedelta(days=1) - pd.Timedelta(seconds=1)
-            df_f = df_f[(df_f["data_base"] >= ini) & (df_f["data_base"] <= fim)]
+            i, j = _fatia_periodo(df_f[col_data], ini, fim)
+            df_f = df_f.iloc[i:j]
+
+    mascara = np.ones(len(df_f), dtype=bool)
 
     if "tipo_desconexao" in df_f.columns:
-        tipos = sorted(df_f["tipo_desconexao"].dropna().unique().tolist())
+        tipos = opcoes["tipo_desconexao"] if opcoes else _opcoes(df_f["tipo_desconexao"])
         if tipos:
             sel_tipo = st.sidebar.multiselect("Tipo de desconexao", tipos, default=tipos, key="filtro_tipo")
-            if sel_tipo:
-                df_f = df_f[df_f["tipo_desconexao"].isin(sel_tipo)]
+            # Com todos marcados, só ficam de fora os registros sem tipo
+            if sel_tipo and len(sel_tipo) == len(tipos):
+                mascara &= df_f["tipo_desconexao"].notna().to_numpy()
+            elif sel_tipo:
+                mascara &= df_f["tipo_desconexao"].isin(sel_tipo).to_numpy()
 
     if "nome_agente" in df_f.columns:
-        agentes = sorted(df_f["nome_agente"].dropna().unique().tolist())
+        if opcoes:
+            agentes = opcoes["nome_agente"]
+        else:
+            agentes = _opcoes(df_f["nome_agente"], None if mascara.all() else mascara)
         if agentes:
             sel_ag = st.sidebar.multiselect("Agente", agentes, default=agentes, key="filtro_agente")
             # Só aplica o filtro se o usuário desmarcou algum agente
             if sel_ag and len(sel_ag) < len(agentes):
-                df_f = df_f[df_f["nome_agente"].isin(sel_ag)]
+                mascara &= df_f["nome_agente"].isin(sel_ag).to_numpy()
 
-    return df_f
+    return df_f if mascara.all() else df_f[mascara]
 
 
-# -------------------- Visao Geral --------------------
+# -------------------- Agregacoes sobre o cubo --------------------
 
-def secao_visao_geral(df):
-    st.subheader("Visao geral")
+COMPONENTES_TEMPO = {
+    "URA":          "ura_segundos",
+    "Fila":         "fila_segundos",
+    "Conversa":     "conversas_segundos",
+    "TPC":          "tpc_segundos",
+    "Tratamento":   "tratamento_segundos",
+}
+
+def _medidas(cubo):
+    """Colunas aditivas do cubo: contagens e, por coluna de segundos, soma e não nulos."""
+    return [
+        c for c in cubo.columns
+        if c in ("atendimentos", "com_data_atendimento") or c.endswith(("__soma", "__n"))
+    ]
+
+def calcular_kpis(cubo, dims=None):
+    """
+    Motor de KPIs das seções. Numa única passada sobre as medidas do cubo (um
+    `groupby().sum()` por `dims`, ou uma soma só sem `dims`) calcula por grupo
+    `atendimentos`, `com_data_atendimento` e, para cada coluna de segundos,
+    `<col>__soma`, `<col>__n` (não nulos) e `<col>__media` (NaN sem valores).
+    Retorna um DataFrame com uma linha por grupo (uma linha só sem `dims`).
+    """
+    medidas = _medidas(cubo)
+    if dims:
+        kpis = cubo.groupby(dims, observed=True)[medidas].sum().reset_index()
+    else:
+        kpis = cubo[medidas].sum().to_frame().T.reset_index(drop=True)
+    for col in COLUNAS_SEGUNDOS:
+        if f"{col}__n" in kpis.columns:
+            n = kpis[f"{col}__n"]
+            kpis[f"{col}__media"] = kpis[f"{col}__soma"] / n.where(n > 0)
+    return kpis
+
+def _media(kpi, col):
+    """Média de `col` numa linha de `calcular_kpis` (NaN se não houver valores)."""
+    return kpi.get(f"{col}__media", np.nan)
+
+def _componentes(kpi):
+    """Tempo médio por componente de COMPONENTES_TEMPO numa linha de KPIs (None se vazio)."""
+    dados = [
+        {"componente": k, "media_s": kpi[f"{v}__media"]}
+        for k, v in COMPONENTES_TEMPO.items()
+        if kpi.get(f"{v}__n", 0) > 0
+    ]
+    if not dados:
+        return None
+    df_comp = pd.DataFrame(dados)
+    df_comp["Tempo medio"] = df_comp["media_s"].apply(formatar_tempo)
+    return df_comp
+
+def _contagem_por(cubo, dim):
+    """Atendimentos por valor de `dim` (sem nulos), do maior para o menor."""
+    contagem = calcular_kpis(cubo, dim).set_index(dim)["atendimentos"]
+    return contagem.loc[contagem > 0].sort_values(ascending=False)
+
+def _resumo_por(cubo, dims):
+    """
+    Por grupo de `dims`: atendimentos, TMA médio (`tma_s`), quantidade de
+    TMAs válidos (`n_tma`) e tempo total em atendimento (`tempo_total_s`).
+    """
+    kpis = calcular_kpis(cubo, dims)
+    col_tma = _col_tma(kpis)
+    resumo = kpis[([dims] if isinstance(dims, str) else list(dims)) + ["atendimentos"]].copy()
+    resumo["n_tma"] = kpis.get(f"{col_tma}__n", 0)
+    resumo["tma_s"] = kpis.get(f"{col_tma}__media", np.nan)
+    resumo["tempo_total_s"] = kpis.get("duracao_segundos__soma", 0)
+    return resumo
+
+def _atendimentos_por_dia(cubo):
+    """Atendimentos com data de atendimento, dia a dia (dias sem registro com zero)."""
+    if "com_data_atendimento" not in cubo.columns:
+        return None
+    por_dia = calcular_kpis(cubo, "dia").set_index("dia")["com_data_atendimento"]
+    por_dia = por_dia.loc[por_dia > 0]
+    if por_dia.empty:
+        return None
+    return por_dia.resample("D").sum().rename_axis("data_atendimento").reset_index(name="atendimentos")
+
+# Séries temporais vão ao navegador com no máximo GRAFICO_MAX_PONTOS pontos:
+# os dias são agrupados na granularidade mais fina que couber. Até
+# GRAFICO_MAX_BARRAS pontos o gráfico é de barras com rótulos; acima disso,
+# linha em WebGL (barras não têm versão WebGL no Plotly).
+GRAFICO_MAX_PONTOS = 400
+GRAFICO_MAX_BARRAS = 62
+GRANULARIDADES = [
+    # (regra do resample, "por ...", "volume ...", formato do eixo)
+    ("D",     "dia",       "diario",     "%d/%m/%Y"),
+    ("W-MON", "semana",    "semanal",    "%d/%m/%Y"),
+    ("MS",    "mes",       "mensal",     "%m/%Y"),
+    ("QS",    "trimestre", "trimestral", "%m/%Y"),
+    ("YS",    "ano",       "anual",      "%Y"),
+]
+
+def agrupar_serie_temporal(df_dia, max_pontos=GRAFICO_MAX_PONTOS):
+    """
+    Reagrupa a série diária de `_atendimentos_por_dia` na granularidade mais
+    fina de GRANULARIDADES que caiba em `max_pontos` (e corta o excesso, se
+    nem a anual couber). Retorna (df, granularidade).
+    """
+    serie = df_dia.set_index("data_atendimento")["atendimentos"]
+    for granularidade in GRANULARIDADES:
+        regra = granularidade[0]
+        agrupada = serie if regra == "D" else serie.resample(regra, label="left", closed="left").sum()
+        if len(agrupada) <= max_pontos:
+            break
+    return agrupada.iloc[-max_pontos:].reset_index(), granularidade
+
+def grafico_serie_temporal(df, granularidade, titulo):
+    """Gráfico de atendimentos no tempo, com eixo de datas (ver GRAFICO_MAX_BARRAS)."""
+    labels = {"data_atendimento": "Data", "atendimentos": "Atendimentos"}
+    if len(df) <= GRAFICO_MAX_BARRAS:
+        fig = px.bar(df, x="data_atendimento", y="atendimentos", text="atendimentos", title=titulo, labels=labels)
+        fig.update_traces(textposition="outside")
+    else:
+        fig = px.line(df, x="data_atendimento", y="atendimentos", title=titulo, labels=labels, render_mode="webgl")
+    fig.update_layout(xaxis_tickangle=-30, xaxis_tickformat=granularidade[3])
+    return fig
+
+
+# -------------------- Memoizacao das secoes --------------------
+
+# Resultados das agregações de cada seção ficam em cache por (versão do
+# histórico + filtros); num acerto só os gráficos são montados.
+SECOES_CACHE_MAX_ENTRADAS = 16
+
+# Colunas cujos valores distintos alimentam os widgets de filtro e das seções
+COLUNAS_OPCOES = ["tipo_desconexao", "nome_agente", "assunto", "mes"]
+
+@st.cache_data(show_spinner=False, max_entries=SECOES_CACHE_MAX_ENTRADAS)
+def opcoes_filtros(_df, chave):
+    """
+    Valores distintos (ordenados, sem nulos) de cada coluna de COLUNAS_OPCOES
+    em `_df`, calculados uma vez por `chave`: a versão do `df` da barra
+    lateral (ver `aplicar_filtros`), a chave dos filtros para as seções.
+    """
+    return {col: _opcoes(_df[col]) if col in _df.columns else [] for col in COLUNAS_OPCOES}
 
+def versao_historico(arquivos):
+    """Identifica uma versão do histórico pelos SHAs dos seus arquivos {caminho: sha}."""
+    return hashlib.sha1(json.dumps(arquivos, sort_keys=True).encode("utf-8")).hexdigest()
+
+def chave_filtros(versao, periodo=None):
+    """
+    Hash canônico da `versao` do cubo (ver `carregar_cubo`) e dos filtros
+    aplicados (período, tipos de desconexão e agentes). Identifica o
+    `df_filtrado` das seções.
+    """
+    estado = st.session_state
+    if periodo is None:
+        selecionado = estado.get("filtro_periodo")
+        if isinstance(selecionado, (list, tuple)) and len(selecionado) == 2:
+            periodo = selecionado
+    filtros = {
+        "historico": versao,
+        "periodo":   [str(d) for d in periodo] if periodo else None,
+        "tipos":     sorted(map(str, estado.get("filtro_tipo") or [])),
+        "agentes":   sorted(map(str, estado.get("filtro_agente") or [])),
+    }
+    return hashlib.sha1(json.dumps(filtros, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+# -------------------- Visao Geral --------------------
+
+@st.cache_data(show_spinner=False, max_entries=SECOES_CACHE_MAX_ENTRADAS)
+def calcular_visao_geral(_df, chave):
+    df = _df
+    kpi = calcular_kpis(df).iloc[0]
     col_tma = _col_tma(df)
+    r = {
+        "total":       int(kpi["atendimentos"]),
+        "tma_medio":   _media(kpi, col_tma),
+        "dur_total":   kpi.get("duracao_segundos__soma", 0),
+        "ura_medio":   _media(kpi, "ura_segundos"),
+        "fila_medio":  _media(kpi, "fila_segundos"),
+        "tpc_medio":   _media(kpi, "tpc_segundos"),
+        "trat_medio":  _media(kpi, "tratamento_segundos"),
+        "aband_medio": _media(kpi, "abandono_segundos"),
+        "componentes": _componentes(kpi),
+        "dia": None, "desconexao": None, "agente": None, "assunto": None,
+    }
+
+    df_dia = _atendimentos_por_dia(df)
+    if df_dia is not None:
+        r["dia"] = agrupar_serie_temporal(df_dia)
+
+    if "tipo_desconexao" in df.columns and df["tipo_desconexao"].notna().any():
+        df_desc = _contagem_por(df, "tipo_desconexao").reset_index()
+        df_desc.columns = ["tipo", "quantidade"]
+        r["desconexao"] = df_desc
+
+    if "nome_agente" in df.columns and df["nome_agente"].notna().any():
+        r["agente"] = _contagem_por(df, "nome_agente").reset_index(name="atendimentos")
+
+    if "assunto" in df.columns and df["assunto"].notna().any():
+        r["assunto"] = _contagem_por(df, "assunto").head(15).reset_index(name="atendimentos")
+
+    return r
+
+def secao_visao_geral(df, chave):
+    st.subheader("Visao geral")
 
-    total       = len(df)
-    tma_medio   = df[col_tma].mean() if col_tma in df.columns else np.nan
-    dur_total   = df["duracao_segundos"].sum() if "duracao_segundos" in df.columns else 0
-    ura_medio   = df["ura_segundos"].mean() if "ura_segundos" in df.columns else np.nan
-    fila_medio  = df["fila_segundos"].mean() if "fila_segundos" in df.columns else np.nan
-    tpc_medio   = df["tpc_segundos"].mean() if "tpc_segundos" in df.columns else np.nan
-    trat_medio  = df["tratamento_segundos"].mean() if "tratamento_segundos" in df.columns else np.nan
-    aband_medio = df["abandono_segundos"].mean() if "abandono_segundos" in df.columns else np.nan
+    r = calcular_visao_geral(df, chave)
 
     m1, m2, m3, m4 = st.columns(4)
-    m1.metric("Total de atendimentos", total)
-    m2.metric("TMA medio", formatar_tempo(tma_medio))
-    m3.metric("Tempo total em atendimento", formatar_tempo(dur_total))
-    m4.metric("Tempo medio na fila", formatar_tempo(fila_medio))
+    m1.metric("Total de atendimentos", r["total"])
+    m2.metric("TMA medio", formatar_tempo(r["tma_medio"]))
+    m3.metric("Tempo total em atendimento", formatar_tempo(r["dur_total"]))
+    m4.metric("Tempo medio na fila", formatar_tempo(r["fila_medio"]))
 
     m5, m6, m7, m8 = st.columns(4)
-    m5.metric("Tempo medio na URA", formatar_tempo(ura_medio))
-    m6.metric("Tempo medio de conversa", formatar_tempo(tma_medio))
-    m7.metric("Tempo medio de tratamento", formatar_tempo(trat_medio))
-    m8.metric("Tempo medio ate abandono", formatar_tempo(aband_medio))
+    m5.metric("Tempo medio na URA", formatar_tempo(r["ura_medio"]))
+    m6.metric("Tempo medio de conversa", formatar_tempo(r["tma_medio"]))
+    m7.metric("Tempo medio de tratamento", formatar_tempo(r["trat_medio"]))
+    m8.metric("Tempo medio ate abandono", formatar_tempo(r["aband_medio"]))
 
     st.markdown("---")
 
-    # Atendimentos por dia
-    if "data_atendimento" in df.columns and df["data_atendimento"].notna().any():
-        df_dia = (
-            df.set_index("data_atendimento")
-            .resample("D")
-            .size()
-            .reset_index(name="atendimentos")
-        )
-        df_dia["data_str"] = df_dia["data_atendimento"].dt.strftime("%d/%m/%Y")
-        fig_dia = px.bar(
-            df_dia, x="data_str", y="atendimentos", text="atendimentos",
-            title="Atendimentos por dia",
-            labels={"data_str": "Data", "atendimentos": "Atendimentos"}
-        )
-        fig_dia.update_traces(textposition="outside")
-        fig_dia.update_layout(xaxis_tickangle=-30)
+    # Atendimentos por dia (ou semana/mes, em periodos longos)
+    if r["dia"] is not None:
+        df_dia, granularidade = r["dia"]
+        fig_dia = grafico_serie_temporal(df_dia, granularidade, f"Atendimentos por {granularidade[1]}")
         st.plotly_chart(fig_dia, use_container_width=True, key="vg_dia")
 
     st.markdown("---")
@@ -578,11 +2147,9 @@ def secao_visao_geral(df):
 
     # Pizza tipo de desconexao
     with c1:
-        if "tipo_desconexao" in df.columns and df["tipo_desconexao"].notna().any():
-            df_desc = df["tipo_desconexao"].dropna().value_counts().reset_index()
-            df_desc.columns = ["tipo", "quantidade"]
+        if r["desconexao"] is not None:
             fig_desc = px.pie(
-                df_desc, names="tipo", values="quantidade",
+                r["desconexao"], names="tipo", values="quantidade",
                 title="Tipos de desconexao",
                 hole=0.4
             )
@@ -591,16 +2158,9 @@ def secao_visao_geral(df):
 
     # Atendimentos por agente
     with c2:
-        if "nome_agente" in df.columns and df["nome_agente"].notna().any():
-            df_ag = (
-                df[df["nome_agente"].notna()]
-                .groupby("nome_agente")
-                .size()
-                .reset_index(name="atendimentos")
-                .sort_values("atendimentos", ascending=False)
-            )
+        if r["agente"] is not None:
             fig_ag = px.bar(
-                df_ag, x="nome_agente", y="atendimentos", text="atendimentos",
+                r["agente"], x="nome_agente", y="atendimentos", text="atendimentos",
                 title="Atendimentos por agente",
                 labels={"nome_agente": "Agente", "atendimentos": "Atendimentos"}
             )
@@ -611,23 +2171,9 @@ def secao_visao_geral(df):
     st.markdown("---")
 
     # Componentes de tempo medio geral
-    componentes = {
-        "URA":          "ura_segundos",
-        "Fila":         "fila_segundos",
-        "Conversa":     "conversas_segundos",
-        "TPC":          "tpc_segundos",
-        "Tratamento":   "tratamento_segundos",
-    }
-    dados_comp = [
-        {"componente": k, "media_s": df[v].mean()}
-        for k, v in componentes.items()
-        if v in df.columns and df[v].notna().any()
-    ]
-    if dados_comp:
-        df_comp = pd.DataFrame(dados_comp)
-        df_comp["Tempo medio"] = df_comp["media_s"].apply(formatar_tempo)
+    if r["componentes"] is not None:
         fig_comp = px.bar(
-            df_comp, x="componente", y="media_s", text="Tempo medio",
+            r["componentes"], x="componente", y="media_s", text="Tempo medio",
             title="Tempo medio por componente (geral)",
             labels={"componente": "Componente", "media_s": "Segundos"}
         )
@@ -637,17 +2183,9 @@ def secao_visao_geral(df):
     st.markdown("---")
 
     # Atendimentos por assunto (se houver Zendesk)
-    if "assunto" in df.columns and df["assunto"].notna().any():
-        df_ass = (
-            df[df["assunto"].notna()]
-            .groupby("assunto")
-            .size()
-            .reset_index(name="atendimentos")
-            .sort_values("atendimentos", ascending=False)
-            .head(15)
-        )
+    if r["assunto"] is not None:
         fig_ass = px.bar(
-            df_ass, x="assunto", y="atendimentos", text="atendimentos",
+            r["assunto"], x="assunto", y="atendimentos", text="atendimentos",
             title="Top 15 assuntos (volume)",
             labels={"assunto": "Assunto", "atendimentos": "Atendimentos"}
         )
@@ -658,28 +2196,21 @@ def secao_visao_geral(df):
 
 # -------------------- Por Agente --------------------
 
-def secao_por_agente(df):
+@st.cache_data(show_spinner=False, max_entries=SECOES_CACHE_MAX_ENTRADAS)
+def calcular_por_agente(_df, chave):
+    df_ag = _resumo_por(_df, "nome_agente").sort_values("atendimentos", ascending=False)
+    df_ag["TMA"]         = df_ag["tma_s"].apply(formatar_tempo)
+    df_ag["Tempo Total"] = df_ag["tempo_total_s"].apply(formatar_tempo)
+    return df_ag
+
+def secao_por_agente(df, chave):
     st.subheader("Atendimentos por agente")
 
-    if "nome_agente" not in df.columns or df["nome_agente"].isna().all():
+    if not opcoes_filtros(df, chave)["nome_agente"]:
         st.info("Sem dados de agente.")
         return
 
-    col_tma = _col_tma(df)
-
-    df_ag = (
-        df[df["nome_agente"].notna()]
-        .groupby("nome_agente")
-        .agg(
-            atendimentos=("nome_agente", "count"),
-            tma_s=(col_tma, "mean"),
-            tempo_total_s=("duracao_segundos", "sum"),
-        )
-        .reset_index()
-        .sort_values("atendimentos", ascending=False)
-    )
-    df_ag["TMA"]         = df_ag["tma_s"].apply(formatar_tempo)
-    df_ag["Tempo Total"] = df_ag["tempo_total_s"].apply(formatar_tempo)
+    df_ag = calcular_por_agente(df, chave)
 
     c1, c2 = st.columns(2)
     with c1:
@@ -709,51 +2240,68 @@ def secao_por_agente(df):
 
 # -------------------- Detalhe Agente --------------------
 
-def secao_detalhe_agente(df):
+@st.cache_resource(show_spinner=False, max_entries=SECOES_CACHE_MAX_ENTRADAS)
+def indice_por_agente(_df, chave):
+    """
+    Posições das linhas de cada agente em `_df` ({agente: array}), montadas
+    numa única passada por `chave` de filtros. Fica em cache_resource (sem
+    cópia a cada leitura) e só é lido.
+    """
+    return _df.groupby("nome_agente", observed=True).indices
+
+@st.cache_data(show_spinner=False, max_entries=SECOES_CACHE_MAX_ENTRADAS)
+def calcular_detalhe_agente(_df, chave, agente):
+    posicoes = indice_por_agente(_df, chave).get(agente)
+    if posicoes is None or len(posicoes) == 0:
+        return None
+    df_ag = _df.take(posicoes)
+
+    kpi = calcular_kpis(df_ag).iloc[0]
+    r = {
+        "total":       int(kpi["atendimentos"]),
+        "tma_med":     _media(kpi, _col_tma(df_ag)),
+        "dur_total":   kpi.get("duracao_segundos__soma", 0),
+        "componentes": _componentes(kpi),
+        "desconexao": None, "dia": None,
+    }
+
+    if "tipo_desconexao" in df_ag.columns and df_ag["tipo_desconexao"].notna().any():
+        df_desc = _contagem_por(df_ag, "tipo_desconexao").reset_index()
+        df_desc.columns = ["tipo", "quantidade"]
+        df_desc["pct"] = (df_desc["quantidade"] / df_desc["quantidade"].sum() * 100).round(1)
+        r["desconexao"] = df_desc
+
+    df_dia = _atendimentos_por_dia(df_ag)
+    if df_dia is not None:
+        r["dia"] = agrupar_serie_temporal(df_dia)
+
+    return r
+
+def secao_detalhe_agente(df, chave):
     st.subheader("Detalhe por agente")
 
-    if "nome_agente" not in df.columns or df["nome_agente"].isna().all():
+    agentes = opcoes_filtros(df, chave)["nome_agente"]
+    if not agentes:
         st.info("Sem dados de agente.")
         return
 
-    agentes = sorted(df["nome_agente"].dropna().unique().tolist())
     agente_sel = st.selectbox("Selecione o agente", agentes, key="sel_agente_detalhe")
 
-    df_ag = df[df["nome_agente"] == agente_sel].copy()
-    if df_ag.empty:
+    r = calcular_detalhe_agente(df, chave, agente_sel)
+    if r is None:
         st.info("Sem dados para este agente.")
         return
 
-    col_tma = _col_tma(df_ag)
-
-    total     = len(df_ag)
-    tma_med   = df_ag[col_tma].mean() if col_tma in df_ag.columns else np.nan
-    dur_total = df_ag["duracao_segundos"].sum() if "duracao_segundos" in df_ag.columns else 0
-
     m1, m2, m3 = st.columns(3)
-    m1.metric("Atendimentos", total)
-    m2.metric("TMA medio", formatar_tempo(tma_med))
-    m3.metric("Tempo total", formatar_tempo(dur_total))
+    m1.metric("Atendimentos", r["total"])
+    m2.metric("TMA medio", formatar_tempo(r["tma_med"]))
+    m3.metric("Tempo total", formatar_tempo(r["dur_total"]))
 
     st.markdown("---")
 
-    componentes = {
-        "URA":        "ura_segundos",
-        "Fila":       "fila_segundos",
-        "Conversa":   "conversas_segundos",
-        "TPC":        "tpc_segundos",
-        "Tratamento": "tratamento_segundos",
-    }
-    dados_comp = [
-        {"componente": k, "media_s": df_ag[v].mean()}
-        for k, v in componentes.items()
-        if v in df_ag.columns and df_ag[v].notna().any()
-    ]
-    if dados_comp:
-        df_comp = pd.DataFrame(dados_comp)
-        df_comp["Tempo medio"] = df_comp["media_s"].apply(formatar_tempo)
+    if r["componentes"] is not None:
         fig = px.bar(
-            df_comp, x="componente", y="media_s", text="Tempo medio",
+            r["componentes"], x="componente", y="media_s", text="Tempo medio",
             title=f"Tempo medio por componente - {agente_sel}",
             labels={"componente": "Componente", "media_s": "Segundos"}
         )
@@ -762,10 +2310,8 @@ def secao_detalhe_agente(df):
 
     st.markdown("---")
 
-    if "tipo_desconexao" in df_ag.columns and df_ag["tipo_desconexao"].notna().any():
-        df_desc = df_ag["tipo_desconexao"].dropna().value_counts().reset_index()
-        df_desc.columns = ["tipo", "quantidade"]
-        df_desc["pct"] = (df_desc["quantidade"] / df_desc["quantidade"].sum() * 100).round(1)
+    if r["desconexao"] is not None:
+        df_desc = r["desconexao"]
 
         c1, c2 = st.columns(2)
         with c1:
@@ -784,48 +2330,32 @@ def secao_detalhe_agente(df):
 
     st.markdown("---")
 
-    if "data_atendimento" in df_ag.columns and df_ag["data_atendimento"].notna().any():
-        df_dia = (
-            df_ag.set_index("data_atendimento")
-            .resample("D")
-            .size()
-            .reset_index(name="atendimentos")
-        )
-        df_dia["data_str"] = df_dia["data_atendimento"].dt.strftime("%d/%m/%Y")
-        fig2 = px.bar(
-            df_dia, x="data_str", y="atendimentos", text="atendimentos",
-            title=f"Volume diario - {agente_sel}",
-            labels={"data_str": "Data", "atendimentos": "Atendimentos"}
-        )
-        fig2.update_traces(textposition="outside")
-        fig2.update_layout(xaxis_tickangle=-30)
+    if r["dia"] is not None:
+        df_dia, granularidade = r["dia"]
+        fig2 = grafico_serie_temporal(df_dia, granularidade, f"Volume {granularidade[2]} - {agente_sel}")
         st.plotly_chart(fig2, use_container_width=True, key="da_volume_diario")
 
 
 # -------------------- Por Assunto --------------------
 
-def secao_por_assunto(df):
+@st.cache_data(show_spinner=False, max_entries=SECOES_CACHE_MAX_ENTRADAS)
+def calcular_por_assunto(_df, chave):
+    # Aqui "atendimentos" conta só os registros com TMA preenchido
+    df_ass = _resumo_por(_df, "assunto")
+    df_ass["atendimentos"] = df_ass["n_tma"]
+    df_ass = df_ass.sort_values("atendimentos", ascending=False)
+    df_ass["TMA"]         = df_ass["tma_s"].apply(formatar_tempo)
+    df_ass["Tempo Total"] = df_ass["tempo_total_s"].apply(formatar_tempo)
+    return df_ass
+
+def secao_por_assunto(df, chave):
     st.subheader("Atendimentos por assunto")
 
-    if "assunto" not in df.columns or df["assunto"].isna().all():
+    if not opcoes_filtros(df, chave)["assunto"]:
         st.info("Ainda nao ha assuntos cruzados com o Zendesk.")
         return
 
-    col_tma = _col_tma(df)
-
-    df_ass = (
-        df[df["assunto"].notna()]
-        .groupby("assunto")
-        .agg(
-            atendimentos=(col_tma, "count"),
-            tma_s=(col_tma, "mean"),
-            tempo_total_s=("duracao_segundos", "sum"),
-        )
-        .reset_index()
-        .sort_values("atendimentos", ascending=False)
-    )
-    df_ass["TMA"]         = df_ass["tma_s"].apply(formatar_tempo)
-    df_ass["Tempo Total"] = df_ass["tempo_total_s"].apply(formatar_tempo)
+    df_ass = calcular_por_assunto(df, chave)
 
     c1, c2 = st.columns(2)
     with c1:
@@ -855,40 +2385,65 @@ def secao_por_assunto(df):
 
 # -------------------- Top TMA por mes --------------------
 
-def secao_top_assuntos_tma(df):
-    st.subheader("Top 10 assuntos por TMA - por mes")
+# Quantos assuntos entram no ranking de TMA de cada mês
+TOP_ASSUNTOS_N = 10
+
+def _mes_ordenado(mes):
+    """`mes` como categórica ordenada cronologicamente ("AAAA-MM"), sem converter os valores."""
+    if not isinstance(mes.dtype, pd.CategoricalDtype):
+        mes = mes.astype("category")
+    return mes.cat.reorder_categories(sorted(mes.cat.categories), ordered=True)
+
+@st.cache_data(show_spinner=False, max_entries=SECOES_CACHE_MAX_ENTRADAS)
+def calcular_top_assuntos_tma(_df, chave, n=TOP_ASSUNTOS_N):
+    """
+    Os `n` assuntos de maior TMA em cada mês, numa passada: um resumo por
+    mês x assunto, ordenado (estável) por mês e TMA decrescente, e o
+    `head(n)` de cada mês. None se não houver nenhum.
+    """
+    resumo = _resumo_por(_df, ["mes", "assunto"])
+    if resumo.empty:
+        return None
+    resumo["mes"] = _mes_ordenado(resumo["mes"])
+    df_top = (
+        resumo.rename(columns={"n_tma": "atendimentos_tma"})
+        .sort_values(["mes", "tma_s"], ascending=[True, False], kind="stable", na_position="last")
+        .groupby("mes", observed=True)
+        .head(n)
+        [["mes", "assunto", "atendimentos_tma", "tma_s"]]
+        .rename(columns={"atendimentos_tma": "atendimentos"})
+        .reset_index(drop=True)
+    )
+    df_top["TMA"] = df_top["tma_s"].apply(formatar_tempo)
+    return df_top
 
-    if "assunto" not in df.columns or df["assunto"].isna().all():
+def secao_top_assuntos_tma(df, chave):
+    n = TOP_ASSUNTOS_N
+    st.subheader(f"Top {n} assuntos por TMA - por mes")
+
+    opcoes = opcoes_filtros(df, chave)
+    if not opcoes["assunto"]:
         st.info("Ainda nao ha assuntos cruzados com o Zendesk.")
         return
 
-    if "mes" not in df.columns or df["mes"].isna().all():
+    if not opcoes["mes"]:
         st.info("Coluna de mes nao disponivel.")
         return
 
-    col_tma = _col_tma(df)
-    meses   = sorted(df["mes"].dropna().astype(str).unique().tolist())
+    meses   = opcoes["mes"]
     mes_sel = st.selectbox("Selecione o mes", meses, key="sel_mes_top_tma")
 
-    df_mes = df[(df["mes"].astype(str) == mes_sel) & df["assunto"].notna()].copy()
-    if df_mes.empty:
+    df_tops = calcular_top_assuntos_tma(df, chave, n)
+    df_top = df_tops[df_tops["mes"] == mes_sel] if df_tops is not None else None
+    if df_top is None or df_top.empty:
         st.info("Sem dados para este mes.")
         return
 
-    df_top = (
-        df_mes.groupby("assunto")
-        .agg(atendimentos=(col_tma, "count"), tma_s=(col_tma, "mean"))
-        .reset_index()
-        .sort_values("tma_s", ascending=False)
-        .head(10)
-    )
-    df_top["TMA"] = df_top["tma_s"].apply(formatar_tempo)
-
     fig = px.bar(
         df_top.sort_values("tma_s", ascending=True),
         x="tma_s", y="assunto", orientation="h",
         text="TMA", color="tma_s", color_continuous_scale="Reds",
-        title=f"Top 10 assuntos com maior TMA - {mes_sel}",
+        title=f"Top {n} assuntos com maior TMA - {mes_sel}",
         labels={"tma_s": "TMA (s)", "assunto": "Assunto"}
     )
     fig.update_traces(textposition="outside")
@@ -902,24 +2457,8 @@ def secao_top_assuntos_tma(df):
 
     if len(meses) > 1:
         st.markdown("**Comparativo entre meses**")
-        df_todos = (
-            df[df["assunto"].notna()]
-            .groupby(["mes", "assunto"])
-            .agg(tma_s=(col_tma, "mean"))
-            .reset_index()
-        )
-        tops = []
-        for m in meses:
-            bloco = (
-                df_todos[df_todos["mes"].astype(str) == m]
-                .sort_values("tma_s", ascending=False)
-                .head(10)
-            )
-            tops.append(bloco)
-        df_comp = pd.concat(tops, ignore_index=True)
-        df_comp["TMA"] = df_comp["tma_s"].apply(formatar_tempo)
         fig2 = px.bar(
-            df_comp, x="assunto", y="tma_s", color="mes",
+            df_tops, x="assunto", y="tma_s", color="mes",
             barmode="group", text="TMA",
             title="TMA por assunto - comparativo entre meses",
             labels={"tma_s": "TMA (s)", "assunto": "Assunto", "mes": "Mes"}
@@ -939,8 +2478,13 @@ def secao_upload():
 
     if arq_gen is not None:
         if st.sidebar.button("Processar e acumular"):
-            df_zen = carregar_zendesk(arq_zen.read(), arq_zen.name) if arq_zen else pd.DataFrame()
-            df_gen = carregar_genesys(arq_gen.read(), arq_gen.name)
+            if arq_zen:
+                zen_bytes = arq_zen.getvalue()
+                df_zen = carregar_zendesk(zen_bytes, arq_zen.name, digest_arquivo(zen_bytes))
+            else:
+                df_zen = pd.DataFrame()
+            gen_bytes = arq_gen.getvalue()
+            df_gen = carregar_genesys(gen_bytes, arq_gen.name, digest_arquivo(gen_bytes))
             df_novo = integrar_dados(df_zen, df_gen)
 
             if df_novo.empty:
@@ -948,18 +2492,22 @@ def secao_upload():
                 return
 
             # Salva o novo lote de dados como um arquivo separado no GitHub
-            if salvar_novo_historico_parcial(df_novo):
-                st.sidebar.success(f"Novo lote de dados salvo no GitHub. Total de {len(df_novo)} registros.")
-                st.rerun()
-            else:
+            # (só os registros novos ou alterados)
+            salvos = salvar_novo_historico_parcial(df_novo)
+            if salvos is None:
                 st.sidebar.error("Falha ao salvar o novo lote de dados no GitHub.")
+            elif salvos == 0:
+                st.sidebar.info("Nenhum registro novo ou alterado: o lote já está no histórico.")
+            else:
+                st.sidebar.success(f"Novo lote de dados salvo no GitHub. {salvos} de {len(df_novo)} registros gravados.")
+                st.rerun()
 
     with st.sidebar.expander("Gerenciar historico"):
         st.warning("Esta seção interage diretamente com o repositório GitHub.")
 
         # Botão para listar arquivos
         if st.button("Listar arquivos de histórico"):
-            parquet_files = [f for f in list_files_in_github_repo() if f.startswith(HISTORICO_PREFIX) and f.endswith(HISTORICO_EXTENSION)]
+            parquet_files = list(listar_arquivos_historico())
             if parquet_files:
                 st.write("Arquivos de histórico no GitHub:")
                 for f in parquet_files:
@@ -967,57 +2515,92 @@ def secao_upload():
             else:
                 st.info("Nenhum arquivo de histórico encontrado no GitHub.")
 
+        # Compactação: um arquivo por mês no lugar dos lotes acumulados
+        if st.button("Compactar histórico (um arquivo por mês)"):
+            with st.spinner("Compactando histórico..."):
+                if compactar_historico():
+                    st.rerun()
+
         # Botão para apagar TODOS os arquivos de histórico
         if st.button("Apagar TODOS os arquivos de histórico do GitHub"):
             confirm = st.checkbox("Confirmar exclusao de TODOS os arquivos de historico?")
             if confirm:
-                parquet_files = [f for f in list_files_in_github_repo() if f.startswith(HISTORICO_PREFIX) and f.endswith(HISTORICO_EXTENSION)]
+                existentes = list_files_with_sha_in_github_repo()
+                parquet_files = listar_arquivos_historico(existentes)
                 if not parquet_files:
                     st.info("Nenhum arquivo de histórico para apagar.")
                 else:
                     st.info(f"Apagando {len(parquet_files)} arquivos de histórico...")
-                    all_deleted = True
-                    for file_path in parquet_files:
-                        if not delete_file_from_github(file_path, f"Exclui arquivo de histórico '{file_path}' via Streamlit"):
-                            all_deleted = False
-                            st.error(f"Falha ao apagar '{file_path}'.")
-                    if all_deleted:
-                        carregar_historico.clear()
+                    # Lotes, manifesto e partições do cubo e do índice de IDs
+                    # saem em um único commit
+                    remover = list(parquet_files) + [HISTORICO_MANIFESTO]
+                    remover += [f for f in existentes if f.startswith((HISTORICO_IDS_PREFIX, HISTORICO_CUBO_PREFIX))]
+                    if commit_arquivos_github({}, remover, "Exclui todos os arquivos de histórico via Streamlit", existentes=existentes):
+                        limpar_cache_historico()
                         st.success("Todos os arquivos de histórico foram apagados do GitHub.")
                         st.rerun()
                     else:
-                        st.error("Alguns arquivos de histórico não puderam ser apagados.")
+                        st.error("Os arquivos de histórico não puderam ser apagados.")
+
+
+# Abas do dashboard, na ordem de exibição
+SECOES = {
+    "Visao geral":       secao_visao_geral,
+    "Por agente":        secao_por_agente,
+    "Detalhe do agente": secao_detalhe_agente,
+    "Por assunto":       secao_por_assunto,
+    "Top TMA por mes":   secao_top_assuntos_tma,
+}
+
+# Renderiza só a seção escolhida (seletor guardado no session_state) em vez
+# de montar as cinco abas a cada interação. Com False, volta às st.tabs.
+NAVEGACAO_SECAO_UNICA = True
+
+def renderizar_secoes(df, chave):
+    if not NAVEGACAO_SECAO_UNICA:
+        for aba, secao in zip(st.tabs(list(SECOES)), SECOES.values()):
+            with aba:
+                secao(df, chave)
+        return
+
+    if st.session_state.get("secao_ativa") not in SECOES:
+        st.session_state["secao_ativa"] = next(iter(SECOES))
+    nome = st.radio(
+        "Seção", list(SECOES), key="secao_ativa",
+        horizontal=True, label_visibility="collapsed"
+    )
+    SECOES[nome](df, chave)
 
 
 def main():
     st.title("Dashboard de Atendimentos - Call Center")
 
-    # Carrega o histórico completo (todos os arquivos) na inicialização
-    df_hist = carregar_historico()
+    # Com o manifesto em dia, o período é escolhido antes e só os arquivos
+    # que o cruzam são carregados; senão, carrega o histórico completo.
+    # As seções trabalham sobre o cubo de agregados diários.
+    limites = limites_periodo_historico()
 
-    secao_upload() # Chama a seção de upload após carregar o histórico
+    secao_upload()
 
-    if df_hist.empty:
-        st.info("Faça o upload do arquivo Genesys (XLSX) para começar, ou verifique se há arquivos de histórico no GitHub e as credenciais estão corretas.")
+    st.sidebar.header("Filtros")
+    periodo = (selecionar_periodo(*limites) or limites) if limites else None
+    cubo, versao = carregar_cubo(periodo)
+
+    if cubo.empty:
+        if limites:
+            st.warning("Nenhum registro para os filtros atuais.")
+        else:
+            st.info("Faça o upload do arquivo Genesys (XLSX) para começar, ou verifique se há arquivos de histórico no GitHub e as credenciais estão corretas.")
         return
 
-    df_filtrado = aplicar_filtros(df_hist)
+    # A versão identifica o cubo recebido: se ele foi agregado de um
+    # histórico podado, as opções da barra lateral dependem também do período
+    df_filtrado = aplicar_filtros(cubo, periodo, versao=versao)
     if df_filtrado.empty:
         st.warning("Nenhum registro para os filtros atuais.")
         return
 
-    aba1, aba2, aba3, aba4, aba5 = st.tabs([
-        "Visao geral",
-        "Por agente",
-        "Detalhe do agente",
-        "Por assunto",
-        "Top TMA por mes",
-    ])
-    with aba1: secao_visao_geral(df_filtrado)
-    with aba2: secao_por_agente(df_filtrado)
-    with aba3: secao_detalhe_agente(df_filtrado)
-    with aba4: secao_por_assunto(df_filtrado)
-    with aba5: secao_top_assuntos_tma(df_filtrado)
+    renderizar_secoes(df_filtrado, chave_filtros(versao, periodo))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,53 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dashboard import duracao_para_segundos, duracoes_para_segundos
+
+
+def corpus_duracoes(n, seed=0):
+    """Valores de duração variados: formas canônicas e quase canônicas, lixo e nulos."""
+    rng = np.random.default_rng(seed)
+    simbolos = list("0123456789:. -+eE,abc") + [" ", "\t", "\n", " ", "١"]
+    valores = []
+    for _ in range(n):
+        forma = rng.integers(0, 6)
+        if forma == 0:
+            partes = [str(rng.integers(0, 10 ** rng.integers(1, 4))) for _ in range(rng.integers(1, 4))]
+            valores.append(":".join(partes))
+        elif forma == 1:
+            h, m, s = rng.integers(0, 100), rng.integers(0, 60), rng.integers(0, 60)
+            espaco = " " * int(rng.integers(0, 3))
+            valores.append(f"{espaco}{h:02d}{espaco}:{m:02d}:{espaco}{s:02d}.{rng.integers(0, 1000)}{espaco}")
+        elif forma == 2:
+            valores.append("".join(rng.choice(simbolos, rng.integers(0, 10))))
+        elif forma == 3:
+            valores.append(str(rng.choice(["", " ", "nan", "NaN", "-5", "+7", "1e3", "12:", ":30", "1::2", "00:00:00"])))
+        elif forma == 4:
+            valores.append(str(rng.integers(0, 10 ** 18)))
+        else:
+            valores.append(None)
+    return valores
+
+
+@pytest.mark.parametrize("dtype", [object, "string"])
+def test_duracoes_equivalem_a_funcao_linha_a_linha(dtype):
+    serie = pd.Series(corpus_duracoes(20_000), dtype=dtype)
+
+    esperado = serie.apply(duracao_para_segundos).astype("float64").to_numpy()
+    obtido = duracoes_para_segundos(serie)
+
+    assert obtido.index.equals(serie.index)
+    np.testing.assert_array_equal(obtido.to_numpy(), esperado)
+
+
+def test_duracoes_numericas_e_nulas():
+    serie = pd.Series([None, np.nan, 5, 12.7, "01:02:03"], dtype=object)
+
+    esperado = serie.apply(duracao_para_segundos).astype("float64").to_numpy()
+    np.testing.assert_array_equal(duracoes_para_segundos(serie).to_numpy(), esperado)
@@ -0,0 +1,29 @@
+import base64
+import json
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dashboard import _CorpoBlobBase64
+
+
+@pytest.mark.parametrize("tamanho", [0, 1, 2, 3, _CorpoBlobBase64.PEDACO - 1, _CorpoBlobBase64.PEDACO, 2 * _CorpoBlobBase64.PEDACO + 1])
+@pytest.mark.parametrize("leitura", [-1, 7, 65536])
+def test_corpo_blob_equivale_ao_json_em_memoria(tamanho, leitura):
+    content_bytes = np.random.default_rng(tamanho).bytes(tamanho)
+    corpo = _CorpoBlobBase64(content_bytes)
+
+    partes = []
+    while True:
+        parte = corpo.read(leitura)
+        if not parte:
+            break
+        partes.append(parte)
+    enviado = b"".join(partes)
+
+    assert len(enviado) == len(corpo)
+    assert json.loads(enviado) == {"encoding": "base64", "content": base64.b64encode(content_bytes).decode("ascii")}
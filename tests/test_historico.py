@@ -0,0 +1,241 @@
+import datetime
+import os
+import sys
+import types
+import uuid
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import dashboard as d
+
+
+class RepositorioEmMemoria:
+    """Árvore {caminho: sha} e blobs de um repositório GitHub, no lugar da API."""
+
+    def __init__(self):
+        self.arvore, self.blobs, self.commits = {}, {}, []
+
+    def listar(self, path=""):
+        return dict(self.arvore)
+
+    def baixar(self, shas, max_workers=None):
+        return [self.blobs.get(sha) for sha in shas]
+
+    def commit(self, adicionar, remover, message, existentes=None):
+        for path, content_bytes in adicionar.items():
+            sha = d.git_blob_sha(content_bytes)
+            self.blobs[sha] = content_bytes
+            self.arvore[path] = sha
+        for path in remover:
+            self.arvore.pop(path, None)
+        self.commits.append((sorted(adicionar), sorted(remover)))
+        return True
+
+    def gravados(self, prefixo):
+        """Caminhos com `prefixo` gravados pelo último commit."""
+        return {path for path in self.commits[-1][0] if path.startswith(prefixo)}
+
+
+class Relogio:
+    """`datetime.datetime.now()` que avança um segundo por chamada (nomes de lote distintos)."""
+
+    def __init__(self):
+        self.agora = datetime.datetime(2025, 6, 1)
+
+    def now(self):
+        self.agora += datetime.timedelta(seconds=1)
+        return self.agora
+
+
+def limpar_estado():
+    d.limpar_cache_historico()
+    estado = d._estado_historico()
+    estado["arquivos"], estado["df"] = {}, pd.DataFrame()
+
+
+@pytest.fixture
+def repo(monkeypatch, tmp_path):
+    repo = RepositorioEmMemoria()
+    monkeypatch.setattr(d, "HISTORICO_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(d, "list_files_with_sha_in_github_repo", repo.listar)
+    monkeypatch.setattr(d, "baixar_blobs_github", repo.baixar)
+    monkeypatch.setattr(d, "commit_arquivos_github", repo.commit)
+    monkeypatch.setattr(d, "datetime", types.SimpleNamespace(datetime=Relogio()))
+    limpar_estado()
+    yield repo
+    limpar_estado()
+
+
+def novos_ids(n, seed):
+    rng = np.random.default_rng(seed)
+    return [str(uuid.UUID(int=int(x))) for x in rng.integers(0, 2 ** 62, n)]
+
+
+def lote(ids, seed, inicio, dias, sem_data=0):
+    """Lote de atendimentos com `ids`, datas em `dias` a partir de `inicio` e as últimas `sem_data` linhas sem data."""
+    rng = np.random.default_rng(seed)
+    n = len(ids)
+    datas = pd.Series(pd.Timestamp(inicio) + pd.to_timedelta(rng.integers(0, dias * 86400, n), unit="s"))
+    df = pd.DataFrame({
+        "id_genesys_norm":    list(ids),
+        "data_atendimento":   datas,
+        "data_base":          datas,
+        "mes":                datas.dt.to_period("M").astype(str),
+        "fila":               rng.choice(["A", "B"], n),
+        "nome_agente":        rng.choice(["Ana", "Bia", "Caio"], n),
+        "tipo_desconexao":    pd.Series(rng.choice(["cliente", "agente"], n)).where(rng.random(n) > 0.1),
+        "assunto":            pd.Series(rng.choice(["s1", "s2", "s3"], n)).where(rng.random(n) > 0.3),
+        "duracao_segundos":   rng.integers(0, 900, n).astype(float),
+        "conversas_segundos": pd.Series(rng.integers(0, 900, n).astype(float)).where(rng.random(n) > 0.2),
+    })
+    if sem_data:
+        df.loc[n - sem_data:, ["data_base", "data_atendimento"]] = pd.NaT
+        df.loc[n - sem_data:, "mes"] = np.nan
+    return df
+
+
+def mover_para(df, dia):
+    df = df.copy()
+    df["data_base"] = df["data_atendimento"] = pd.Timestamp(dia)
+    df["mes"] = pd.Timestamp(dia).strftime("%Y-%m")
+    return df
+
+
+def salvar(df):
+    gravados = d.salvar_novo_historico_parcial(df, descartar_colunas_brutas=False)
+    limpar_estado()
+    return gravados
+
+
+def canonico(df):
+    df = df.copy()
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype(object)
+    dims = [c for c in d.DIMENSOES_CUBO if c in df.columns]
+    return df.sort_values(dims, na_position="last").reset_index(drop=True)[sorted(df.columns)]
+
+
+def verificar_derivados(lotes):
+    """Índice de IDs e cubo gravados equivalem à reconstrução a partir de todos os lotes."""
+    completo = pd.concat(lotes, ignore_index=True).drop_duplicates(subset=["id_genesys_norm"], keep="last")
+    completo = d.normalizar_esquema_historico(completo.reset_index(drop=True))
+
+    arquivos, documento = d.carregar_indice_historico()
+    assert d._derivado_em_dia(arquivos, documento, "ids")
+    assert d._derivado_em_dia(arquivos, documento, "cubo")
+
+    indice = {mes: par for mes, par in d.carregar_indice_ids(arquivos, documento).items() if len(par[0])}
+    esperado = d.construir_indice_ids(completo)
+    assert indice.keys() == esperado.keys()
+    for mes, (ids, hashes) in esperado.items():
+        np.testing.assert_array_equal(indice[mes][0], ids)
+        np.testing.assert_array_equal(indice[mes][1], hashes)
+
+    cubo, _ = d.carregar_cubo(None)
+    pd.testing.assert_frame_equal(canonico(cubo), canonico(d.construir_cubo(completo)), check_dtype=False)
+
+
+def test_reenvio_sobreposto_nao_grava_nada(repo):
+    df = lote(novos_ids(500, 1), 1, "2025-01-01", 59)
+    assert salvar(df) == 500
+    commits = len(repo.commits)
+
+    assert salvar(df.sample(frac=1, random_state=0)) == 0
+    assert len(repo.commits) == commits
+
+
+def test_linha_alterada_e_gravada(repo):
+    df = lote(novos_ids(500, 2), 2, "2025-01-01", 28)
+    salvar(df)
+
+    alterado = df.copy()
+    alterado.loc[:9, "duracao_segundos"] += 7
+    assert salvar(alterado) == 10
+    assert repo.gravados(d.HISTORICO_IDS_PREFIX) == {f"{d.HISTORICO_IDS_PREFIX}2025-01{d.HISTORICO_EXTENSION}"}
+
+
+def test_mudanca_de_mes_regrava_as_duas_particoes(repo):
+    df = lote(novos_ids(500, 3), 3, "2025-01-01", 28)
+    salvar(df)
+
+    assert salvar(mover_para(df.iloc[:20], "2025-04-10")) == 20
+    for prefixo in (d.HISTORICO_IDS_PREFIX, d.HISTORICO_CUBO_PREFIX):
+        assert repo.gravados(prefixo) == {f"{prefixo}{mes}{d.HISTORICO_EXTENSION}" for mes in ("2025-01", "2025-04")}
+
+    arquivos, documento = d.carregar_indice_historico()
+    indice = d.carregar_indice_ids(arquivos, documento)
+    assert len(indice["2025-01"][0]) == 480 and len(indice["2025-04"][0]) == 20
+
+
+def test_derivados_equivalem_a_reconstrucao_apos_gravacoes_e_compactacao(repo):
+    ids = novos_ids(3000, 4)
+    primeiro = lote(ids[:1500], 4, "2025-01-01", 59, sem_data=30)
+    alterados = primeiro.iloc[100:400].copy()
+    alterados["duracao_segundos"] += 7
+    lotes = [
+        primeiro,
+        lote(ids[1500:2300], 5, "2025-03-01", 30),
+        pd.concat([alterados, mover_para(primeiro.iloc[500:700], "2025-04-10"), lote(ids[2300:2800], 6, "2025-04-01", 30)]),
+    ]
+    for df in lotes:
+        salvar(df)
+    verificar_derivados(lotes)
+
+    assert d.compactar_historico()
+    limpar_estado()
+    verificar_derivados(lotes)
+
+    lotes.append(lote(ids[2800:], 7, "2025-02-01", 10))
+    salvar(lotes[-1])
+    assert repo.gravados(d.HISTORICO_IDS_PREFIX) == {f"{d.HISTORICO_IDS_PREFIX}2025-02{d.HISTORICO_EXTENSION}"}
+    verificar_derivados(lotes)
+
+
+def test_cubo_le_so_os_meses_do_periodo(repo, monkeypatch):
+    ids = novos_ids(1500, 10)
+    salvar(lote(ids[:1000], 10, "2025-01-01", 90, sem_data=20))
+    salvar(lote(ids[1000:], 11, "2025-03-01", 30))
+    completo, versao = d.carregar_cubo(None)
+
+    lidos = []
+    baixar = d.baixar_arquivos_historico
+    monkeypatch.setattr(d, "baixar_arquivos_historico", lambda arquivos, **kw: lidos.extend(arquivos) or baixar(arquivos, **kw))
+    periodo = (datetime.date(2025, 2, 10), datetime.date(2025, 3, 5))
+    cubo, versao_periodo = d.carregar_cubo(periodo)
+
+    assert lidos == [f"{d.HISTORICO_CUBO_PREFIX}{mes}{d.HISTORICO_EXTENSION}" for mes in ("2025-02", "2025-03")]
+    assert versao_periodo != versao
+    esperado = completo[completo["mes"].isin(["2025-02", "2025-03"])]
+    pd.testing.assert_frame_equal(canonico(cubo), canonico(esperado), check_dtype=False)
+
+
+def test_dividir_em_shards_respeita_o_limite_e_preserva_as_linhas():
+    df = d.normalizar_esquema_historico(lote(novos_ids(20_000, 8), 8, "2025-01-01", 90, sem_data=50))
+    max_bytes = len(d.df_to_parquet_bytes(df)) // 5
+
+    shards = d.dividir_em_shards(df, max_bytes)
+
+    assert len(shards) > 1
+    assert all(len(content_bytes) <= max_bytes for _, content_bytes in shards)
+    for df_parte, content_bytes in shards:
+        pd.testing.assert_frame_equal(d.parquet_bytes_to_df(content_bytes), df_parte)
+    juntos = d.concatenar_historico([df_parte for df_parte, _ in shards])
+    pd.testing.assert_frame_equal(
+        juntos.sort_values("id_genesys_norm", ignore_index=True),
+        df.sort_values("id_genesys_norm", ignore_index=True),
+        check_categorical=False,
+    )
+    datas = juntos["data_base"]
+    assert datas.iloc[: datas.notna().sum()].is_monotonic_increasing
+
+
+def test_dividir_em_shards_mantem_arquivo_pequeno_inteiro():
+    df = lote(novos_ids(100, 9), 9, "2025-01-01", 10)
+    [(df_parte, content_bytes)] = d.dividir_em_shards(df)
+    assert df_parte is df
+    assert content_bytes == d.df_to_parquet_bytes(df)
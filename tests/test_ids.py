@@ -0,0 +1,68 @@
+import os
+import sys
+import uuid
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dashboard import ids_para_inteiros, normalizar_id, normalizar_ids
+
+
+def corpus_ids(n, seed=0):
+    """IDs de conversa como chegam nas planilhas: UUIDs em caixas e contextos variados, lixo e nulos."""
+    rng = np.random.default_rng(seed)
+    ruido = list("0123456789abcdefABCDEF-_: xyzçé") + ["\t", "\n", "İ", "ß", "١"]
+    valores = []
+    for _ in range(n):
+        u = str(uuid.UUID(int=int(rng.integers(0, 2 ** 62)) << 64 | int(rng.integers(0, 2 ** 62))))
+        forma = rng.integers(0, 7)
+        if forma == 0:
+            valores.append(u)
+        elif forma == 1:
+            valores.append(f"{' ' * int(rng.integers(0, 3))}{u.upper()}{' ' * int(rng.integers(0, 3))}")
+        elif forma == 2:
+            antes, depois = ("".join(rng.choice(ruido, rng.integers(0, 8))) for _ in range(2))
+            valores.append(f"{antes}{u}{depois}")
+        elif forma == 3:
+            # UUID truncado ou com um caractere trocado
+            i = int(rng.integers(0, len(u)))
+            valores.append(u[:i] + str(rng.choice(["", "g", "-", " "])) + u[i + 1:])
+        elif forma == 4:
+            valores.append("".join(rng.choice(ruido, rng.integers(0, 40))))
+        elif forma == 5:
+            valores.append(str(rng.choice(["", " ", "nan", "NaN", "None", "0"])))
+        else:
+            valores.append(None)
+    return valores
+
+
+@pytest.mark.parametrize("dtype", [object, "string"])
+def test_normalizar_ids_equivale_a_funcao_linha_a_linha(dtype):
+    serie = pd.Series(corpus_ids(20_000), dtype=dtype)
+
+    esperado = serie.astype(object).apply(normalizar_id)
+    obtido = normalizar_ids(serie)
+
+    assert obtido.index.equals(serie.index)
+    pd.testing.assert_series_equal(obtido, esperado, check_dtype=False)
+
+
+def test_normalizar_ids_numericos_e_nulos():
+    serie = pd.Series([None, np.nan, 5, 12.7, "550E8400-E29B-41D4-A716-446655440000"], dtype=object)
+    pd.testing.assert_series_equal(normalizar_ids(serie), serie.apply(normalizar_id), check_dtype=False)
+
+
+def test_ids_para_inteiros_preserva_os_128_bits():
+    ids = normalizar_ids(pd.Series(corpus_ids(2_000, seed=1)))
+    hi, lo = ids_para_inteiros(ids)
+
+    assert (hi.isna() == ids.isna()).all() and (lo.isna() == ids.isna()).all()
+    validos = ids.notna()
+    reconstruidos = [
+        str(uuid.UUID(int=(int(h) % 2 ** 64) << 64 | (int(l) % 2 ** 64)))
+        for h, l in zip(hi[validos], lo[validos])
+    ]
+    assert reconstruidos == ids[validos].tolist()